@@ -0,0 +1,11 @@
+from models.authorization import User
+
+
+def initial_schema(connection) -> None:
+    # checkfirst keeps this safe on databases created before migrations existed
+    User.__table__.metadata.create_all(connection)
+
+
+MIGRATIONS = [
+    (1, "Initial schema", initial_schema),
+]
@@ -0,0 +1,118 @@
+from collections import deque
+from observability.metrics import DB_POOL_CHECKOUT_WAIT
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+import os
+import time
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Connections older than this are replaced on checkout; -1 keeps them forever
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Pinging costs a round trip per checkout; recycling already retires connections before
+# server or proxy idle timeouts, so pinging is only needed behind flaky networks
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() in ("1", "true", "yes")
+# Server-side limit per statement, 0 disables it
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+# Prepared statements cached per asyncpg connection; set 0 behind PgBouncer in transaction mode
+DB_PREPARED_STATEMENT_CACHE_SIZE = int(os.getenv("DB_PREPARED_STATEMENT_CACHE_SIZE", "100"))
+CHECKOUT_SAMPLES = 1000
+
+
+class CheckoutTimer:
+    """Records how long callers waited for a connection, the queueing part of a slow request."""
+
+    def _init_timer(self) -> None:
+        self.waits = deque(maxlen=CHECKOUT_SAMPLES)
+        self.checkouts = 0
+        self.timeouts = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            self.timeouts += 1
+            raise
+        finally:
+            wait = time.perf_counter() - started
+            self.checkouts += 1
+            self.waits.append(wait)
+            DB_POOL_CHECKOUT_WAIT.labels(self.kind).observe(wait)
+
+
+class TimedQueuePool(CheckoutTimer, QueuePool):
+    kind = "sync"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._init_timer()
+
+
+class TimedAsyncQueuePool(CheckoutTimer, AsyncAdaptedQueuePool):
+    kind = "async"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._init_timer()
+
+
+def pool_options(poolclass) -> dict:
+    return {
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def sync_connect_args(url: str) -> dict:
+    # Driver options for psycopg2; a SQLite stand-in (benchmarks) takes none
+    if not url.startswith("postgresql"):
+        return {}
+    args = {"connect_timeout": 10}
+    if DB_STATEMENT_TIMEOUT_MS:
+        args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+    return args
+
+
+def async_connect_args(url: str) -> dict:
+    if not url.startswith("postgresql"):
+        return {}
+    # prepared_statement_cache_size is SQLAlchemy's per-connection cache, statement_cache_size asyncpg's own
+    args = {
+        "timeout": 10,
+        "prepared_statement_cache_size": DB_PREPARED_STATEMENT_CACHE_SIZE,
+        "statement_cache_size": DB_PREPARED_STATEMENT_CACHE_SIZE,
+    }
+    if DB_STATEMENT_TIMEOUT_MS:
+        args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+    return args
+
+
+def _percentile(ordered, p):
+    return round(ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000, 3)
+
+
+def pool_stats(engine) -> dict:
+    pool = getattr(engine, "sync_engine", engine).pool
+    stats = {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(0, pool.overflow()),
+        "max_overflow": DB_MAX_OVERFLOW,
+    }
+    waits = sorted(getattr(pool, "waits", ()))
+    if waits:
+        stats["checkouts"] = pool.checkouts
+        stats["timeouts"] = pool.timeouts
+        stats["checkout_wait_ms"] = {
+            "p50": _percentile(waits, 50),
+            "p95": _percentile(waits, 95),
+            "p99": _percentile(waits, 99),
+            "max": round(waits[-1] * 1000, 3),
+        }
+    return stats
@@ -1,16 +1,24 @@
 from fastapi import FastAPI, Depends, HTTPException, status, Form, Header
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlmodel import select, Session
-from passlib.context import CryptContext
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 import os
 from typing import Optional
 from models.authorization import User
-from database.db import get_session, wait_for_db
+from database.db import apply_migrations, async_engine, engine, get_session, ping_db, wait_for_db
+from database.migrations import MIGRATIONS
+from database.pool import pool_stats
+from observability.health import Startup, setup_health
+from observability.log import setup_logging
+from observability.metrics import setup_metrics
+from observability.profiling import setup_profiling
+from middleware.admission import setup_admission
+from security.passwords import get_password_hash, shutdown_executor, verify_password
 import logging
 
-logging.basicConfig(level=logging.INFO)
+setup_logging(engine, async_engine)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(
@@ -18,8 +26,16 @@ app = FastAPI(
     description="API for user authentication and authorization",
     version="1.0.0",
 )
+setup_metrics(app, engine, async_engine)
+setup_profiling(app, engine, async_engine)
+setup_admission(app)
+
+startup = Startup(
+    ("database", wait_for_db),
+    ("migrations", lambda: apply_migrations(MIGRATIONS)),
+)
+setup_health(app, startup, ping_db)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
@@ -30,16 +46,18 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 @app.on_event("startup")
 async def startup_event():
     logger.info("Starting auth service...")
-    wait_for_db()
-    logger.info("Service ready")
+    startup.start()
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+@app.on_event("shutdown")
+async def shutdown_event():
+    await startup.cancel()
+    shutdown_executor()
 
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+@app.get("/internal/db-pool", include_in_schema=False)
+async def db_pool_stats():
+    return {"sync": pool_stats(engine), "async": pool_stats(async_engine)}
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -49,15 +67,24 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-async def get_user_by_email(session: Session, email: str) -> Optional[User]:
-    result = session.exec(select(User).where(User.email == email))
+async def get_user_by_email(session: AsyncSession, email: str) -> Optional[User]:
+    result = await session.exec(select(User).where(User.email == email))
     return result.first()
 
 
-async def authenticate_user(session: Session, email: str, password: str) -> Optional[User]:
+async def authenticate_user(session: AsyncSession, email: str, password: str) -> Optional[User]:
     user = await get_user_by_email(session, email)
-    if not user or not verify_password(password, user.hashed_password):
+    if not user:
+        return None
+
+    valid, new_hash = await verify_password(password, user.hashed_password)
+    if not valid:
         return None
+    if new_hash:
+        user.hashed_password = new_hash
+        session.add(user)
+        await session.commit()
+        logger.info(f"Password hash upgraded for {user.email}")
     return user
 
 
@@ -65,7 +92,7 @@ async def authenticate_user(session: Session, email: str, password: str) -> Opti
 async def register(
         email: str,
         password: str,
-        session: Session = Depends(get_session)
+        session: AsyncSession = Depends(get_session)
 ):
     existing_user = await get_user_by_email(session, email)
     if existing_user:
@@ -74,7 +101,7 @@ async def register(
             detail="Email already registered"
         )
 
-    hashed_password = get_password_hash(password)
+    hashed_password = await get_password_hash(password)
     user = User(
         email=email,
         hashed_password=hashed_password,
@@ -82,8 +109,8 @@ async def register(
     )
 
     session.add(user)
-    session.commit()
-    session.refresh(user)
+    await session.commit()
+    await session.refresh(user)
 
     logger.info(f"New user registered: {user.email}")
     return {"email": user.email, "is_active": user.is_active}
@@ -93,7 +120,7 @@ async def register(
 async def login_for_access_token(
         email: str = Form(...),
         password: str = Form(...),
-        session: Session = Depends(get_session)
+        session: AsyncSession = Depends(get_session)
 ):
     user = await authenticate_user(session, email, password)
     if not user:
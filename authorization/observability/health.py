@@ -0,0 +1,89 @@
+from fastapi import FastAPI, status
+from fastapi.responses import JSONResponse
+from observability.log import flush_logs
+from observability.metrics import STARTUP_DURATION
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+IMPORTED_AT = time.perf_counter()
+HEALTH_DB_TIMEOUT = float(os.getenv("HEALTH_DB_TIMEOUT", "1"))
+# A failed startup ends the process with status 1, so the restart policy (restart: on-failure)
+# gets another go; orchestrators don't restart a container that merely reports unhealthy
+STARTUP_FAILURE_EXIT = os.getenv("STARTUP_FAILURE_EXIT", "true").lower() in ("1", "true", "yes")
+
+Step = Tuple[str, Callable[[], Awaitable]]
+
+
+class Startup:
+    """Runs the startup steps in a background task.
+
+    The server starts accepting connections at once, so /health/live answers while the
+    database is still coming up and /health/ready flips once every step has finished.
+    """
+
+    def __init__(self, *steps: Step):
+        self.steps = steps
+        self.phases: Dict[str, float] = {}
+        self.ready = False
+        self.error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self.phases["import"] = (time.perf_counter() - IMPORTED_AT) * 1000
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        try:
+            for name, step in self.steps:
+                started = time.perf_counter()
+                await step()
+                self.phases[name] = (time.perf_counter() - started) * 1000
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {str(e)}"
+            logger.exception("Startup failed")
+            if STARTUP_FAILURE_EXIT:
+                # Stopping the server via a signal would exit with status 0; only probes are served yet
+                flush_logs()
+                os._exit(1)
+            return
+        self.phases["total"] = (time.perf_counter() - IMPORTED_AT) * 1000
+        for phase, ms in self.phases.items():
+            STARTUP_DURATION.labels(phase).set(ms / 1000)
+        self.ready = True
+        timings = ", ".join(f"{phase} {ms:.0f} ms" for phase, ms in self.phases.items())
+        logger.info(f"Ready: {timings}")
+
+    async def cancel(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def report(self) -> dict:
+        return {"phases_ms": {phase: round(ms, 1) for phase, ms in self.phases.items()}}
+
+
+def setup_health(app: FastAPI, startup: Startup, ping: Callable[[], Awaitable]) -> None:
+    @app.get("/health/live", include_in_schema=False)
+    async def live():
+        # A failed startup will not recover on its own, so ask for a restart
+        if startup.error:
+            return JSONResponse({"status": "failed", "error": startup.error},
+                                status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return {"status": "alive"}
+
+    @app.get("/health/ready", include_in_schema=False)
+    async def ready():
+        if not startup.ready:
+            return JSONResponse({"status": "failed" if startup.error else "starting", **startup.report()},
+                                status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+        try:
+            await asyncio.wait_for(ping(), HEALTH_DB_TIMEOUT)
+        except Exception as e:
+            return JSONResponse({"status": "unavailable", "error": f"database: {type(e).__name__}"},
+                                status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return {"status": "ready", **startup.report()}
@@ -0,0 +1,194 @@
+"""Fault injection for the resilient upstream client in clients/http.py.
+
+Starts a local stand-in upstream on a free port (uvicorn), then drives the films service's
+UpstreamClients against it while the stand-in answers slowly, fails, recovers or goes away:
+
+    python benchmarks/fault_injection.py
+
+Prints a JSON report per scenario and exits with status 1 when a scenario did not behave:
+retries beyond the budget, a call outliving its deadline, or a breaker that did not open,
+fail fast, or close again once the stand-in recovered.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import time
+
+FILMS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "films")
+UPSTREAM = "standin"
+
+# Read by clients/resilience.py and clients/http.py at import time
+SETTINGS = {
+    "LOG_LEVEL": "ERROR",
+    "HTTP_TIMEOUT": "1",
+    "STANDIN_DEADLINE": "0.5",
+    "UPSTREAM_MAX_ATTEMPTS": "3",
+    "UPSTREAM_BACKOFF_BASE": "0.01",
+    "UPSTREAM_BACKOFF_MAX": "0.05",
+    "RETRY_BUDGET_RATIO": "0.2",
+    "RETRY_BUDGET_MAX": "5",
+    "BREAKER_FAILURE_THRESHOLD": "5",
+    "BREAKER_RESET_TIMEOUT": "0.5",
+}
+
+
+class StandIn:
+    """ASGI upstream whose behaviour is switched between requests."""
+
+    def __init__(self):
+        self.mode = "ok"
+        self.failures_left = 0
+        self.delay = 0.0
+        self.hits = 0
+
+    def set(self, mode: str = "ok", failures: int = 0, delay: float = 0.0) -> None:
+        self.mode, self.failures_left, self.delay, self.hits = mode, failures, delay, 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        self.hits += 1
+        status = 200
+        if self.mode == "slow":
+            await asyncio.sleep(self.delay)
+        elif self.mode == "error" or (self.mode == "flaky" and self.failures_left > 0):
+            self.failures_left -= 1
+            status = 503
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b'{"ok": true}'})
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def timed(call):
+    started = time.perf_counter()
+    try:
+        outcome = (await call()).status_code
+    except Exception as e:
+        outcome = type(e).__name__
+    return outcome, time.perf_counter() - started
+
+
+async def run():
+    import uvicorn
+    from clients.http import UpstreamClients
+    from clients.resilience import CircuitBreaker, RetryBudget
+
+    standin = StandIn()
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(standin, host="127.0.0.1", port=port, log_level="error"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    deadline = float(SETTINGS["STANDIN_DEADLINE"])
+    threshold = int(SETTINGS["BREAKER_FAILURE_THRESHOLD"])
+    reset_timeout = float(SETTINGS["BREAKER_RESET_TIMEOUT"])
+    budget_max = float(SETTINGS["RETRY_BUDGET_MAX"])
+    budget_ratio = float(SETTINGS["RETRY_BUDGET_RATIO"])
+    report = {}
+
+    def fresh():
+        return UpstreamClients(urls={UPSTREAM: f"http://127.0.0.1:{port}"})
+
+    def record(name, checks, **details):
+        failed = [check for check, ok in checks.items() if not ok]
+        report[name] = {"passed": not failed, "failed_checks": failed, **details}
+
+    clients = fresh()
+    standin.set("ok")
+    outcomes = [await timed(lambda: clients.request(UPSTREAM, "GET", "/films/1")) for _ in range(20)]
+    record("healthy", {"all_ok": all(o == 200 for o, _ in outcomes), "no_retries": standin.hits == 20},
+           hits=standin.hits)
+
+    standin.set("flaky", failures=2)
+    outcome, _ = await timed(lambda: clients.request(UPSTREAM, "GET", "/films/1"))
+    record("flaky_get_is_retried", {"recovered": outcome == 200, "three_attempts": standin.hits == 3},
+           outcome=outcome, hits=standin.hits)
+
+    standin.set("flaky", failures=2)
+    outcome, _ = await timed(lambda: clients.request(UPSTREAM, "POST", "/films"))
+    record("flaky_post_is_not_retried", {"failed": outcome == 503, "one_attempt": standin.hits == 1},
+           outcome=outcome, hits=standin.hits)
+
+    clients = fresh()
+    standin.set("slow", delay=deadline * 4)
+    outcome, elapsed = await timed(lambda: clients.request(UPSTREAM, "GET", "/films/1"))
+    record("slow_upstream_hits_deadline",
+           {"failed": outcome == "UpstreamUnavailable", "within_deadline": elapsed < deadline + 0.1},
+           outcome=outcome, elapsed_s=round(elapsed, 3))
+
+    # A breaker that never opens isolates the budget: without it every call would make three attempts
+    clients = fresh()
+    calls = 100
+    clients._policies[UPSTREAM] = (CircuitBreaker(UPSTREAM, failure_threshold=calls * 10), RetryBudget())
+    standin.set("error")
+    for _ in range(calls):
+        await clients.request(UPSTREAM, "GET", "/films/1")
+    allowed = calls + budget_max + budget_ratio * calls
+    record("retry_budget_caps_retries", {"bounded": standin.hits <= allowed}, calls=calls, hits=standin.hits,
+           max_allowed=allowed, unbudgeted=calls * 3)
+
+    clients = fresh()
+    standin.set("error")
+    outcomes = [await timed(lambda: clients.request(UPSTREAM, "GET", "/films/1")) for _ in range(20)]
+    # The call that opens the breaker still made real attempts; the ones after it must not
+    rejected = [elapsed for outcome, elapsed in outcomes[2:] if outcome == "UpstreamUnavailable"]
+    opened_after = standin.hits
+    standin.set("ok")
+    await asyncio.sleep(reset_timeout)
+    outcome, _ = await timed(lambda: clients.request(UPSTREAM, "GET", "/films/1"))
+    record("breaker_opens_and_recovers", {
+        "opened_at_threshold": opened_after == threshold,
+        "fails_fast": len(rejected) == len(outcomes) - 2 and max(rejected) < 0.01,
+        "probe_closes": outcome == 200 and clients.policy(UPSTREAM)[0].state == "closed",
+    }, hits_before_open=opened_after, rejected=len(rejected),
+        max_rejected_ms=round(max(rejected) * 1000, 3) if rejected else None)
+
+    server.should_exit = True
+    await serving
+    clients = fresh()
+    outcomes = [await timed(lambda: clients.request(UPSTREAM, "POST", "/films")) for _ in range(10)]
+    breaker = clients.policy(UPSTREAM)[0]
+    record("refused_connections_open_breaker", {
+        "all_failed": all(o == "UpstreamUnavailable" for o, _ in outcomes),
+        "opened": breaker.state == "open",
+        "fails_fast": max(elapsed for _, elapsed in outcomes[-3:]) < 0.01,
+    }, state=breaker.state)
+    await clients.aclose()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    for key, value in SETTINGS.items():
+        os.environ.setdefault(key, value)
+        SETTINGS[key] = os.environ[key]
+    sys.path.insert(0, FILMS_DIR)
+    logging.basicConfig(level=os.environ["LOG_LEVEL"])
+
+    report = asyncio.run(run())
+    failures = [name for name, result in report.items() if not result["passed"]]
+    output = json.dumps({"scenarios": report, "failures": failures}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Login throughput and /verify latency during a login storm.
+
+Runs the authorization app in-process over ASGI with its database dependency pointed at
+a throwaway SQLite file (needs aiosqlite). Each PASSWORD_HASH_EXECUTOR mode runs in its
+own interpreter because the setting is read at import time:
+
+    python benchmarks/login_storm.py --modes inline thread --duration 10 --concurrency 32
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+AUTH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "authorization")
+
+
+def percentile(samples, p):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))], 3)
+
+
+def summary(samples):
+    return {
+        "count": len(samples),
+        "p50_ms": percentile(samples, 50),
+        "p99_ms": percentile(samples, 99),
+        "max_ms": round(max(samples), 3) if samples else None,
+    }
+
+
+async def storm(args):
+    import httpx
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlmodel import SQLModel
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    sys.path.insert(0, AUTH_DIR)
+    import main
+    from database.db import get_session
+
+    db_path = os.path.join(tempfile.mkdtemp(), "auth.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    async with engine.begin() as connection:
+        await connection.run_sync(SQLModel.metadata.create_all)
+
+    async def sqlite_session():
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            yield session
+
+    main.app.dependency_overrides[get_session] = sqlite_session
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://auth", timeout=None) as client:
+        for i in range(args.users):
+            await client.post("/register", params={"email": f"user{i}@bench", "password": "secret"})
+        r = await client.post("/token", data={"email": "user0@bench", "password": "secret"})
+        verify_headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+        deadline = time.perf_counter() + args.duration
+        login_samples, verify_samples = [], []
+
+        async def login_worker(worker):
+            i = worker
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                await client.post("/token", data={"email": f"user{i % args.users}@bench", "password": "secret"})
+                login_samples.append((time.perf_counter() - started) * 1000)
+                i += args.concurrency
+
+        async def verify_prober():
+            # Latency is measured from the scheduled send time, so probes delayed by a
+            # blocked event loop count against /verify instead of silently being skipped
+            scheduled = time.perf_counter()
+            while scheduled < deadline:
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await client.post("/verify", headers=verify_headers)
+                verify_samples.append((time.perf_counter() - scheduled) * 1000)
+                scheduled += args.verify_interval / 1000
+
+        started = time.perf_counter()
+        await asyncio.gather(verify_prober(), *[login_worker(w) for w in range(args.concurrency)])
+        elapsed = time.perf_counter() - started
+
+    await engine.dispose()
+    return {
+        "executor": os.environ.get("PASSWORD_HASH_EXECUTOR", "thread"),
+        "bcrypt_rounds": int(os.environ.get("BCRYPT_ROUNDS", "12")),
+        "concurrency": args.concurrency,
+        "login_throughput_rps": round(len(login_samples) / elapsed, 2),
+        "login": summary(login_samples),
+        "verify": summary(verify_samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", default=["inline", "thread"],
+                        choices=["inline", "thread", "process"])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--verify-interval", type=float, default=10, help="Milliseconds between /verify probes")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(asyncio.run(storm(args))))
+        return
+
+    results = []
+    for mode in args.modes:
+        env = {**os.environ, "PASSWORD_HASH_EXECUTOR": mode, "BCRYPT_ROUNDS": str(args.rounds)}
+        command = [sys.executable, __file__, "--worker", "--duration", str(args.duration),
+                   "--concurrency", str(args.concurrency), "--users", str(args.users),
+                   "--verify-interval", str(args.verify_interval)]
+        completed = subprocess.run(command, env=env, capture_output=True, text=True, check=True)
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    output = json.dumps({"results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""CPU cost of the list endpoints with and without the fast serialization path.
+
+Loads films, reviews and users in-process (see load_suite.py) on throwaway SQLite databases,
+seeds --rows rows into each and requests the unbounded listing through both paths:
+
+    python benchmarks/serialization_benchmark.py --rows 10000 --repeat 5
+
+The model path loads ORM objects and lets response_model validate and encode them; the fast
+path (FAST_LIST_RESPONSES, utils/fast_json.py) encodes the fetched column tuples directly.
+Prints the median process CPU time per 10k rows for each path and exits with status 1 when
+the two paths answer with different content or cursors. Bodies are compared with their keys
+sorted: the model path writes the keys of a row in whatever order the ORM loaded them, which
+changes between processes, while the fast path always follows the field order.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import load_suite
+
+LISTINGS = {"films": "/films", "reviews": "/reviews", "users": "/users"}
+# utils/pagination.py
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def film_rows(count, rng):
+    return [{
+        "title": f"{rng.choice(load_suite.TITLE_WORDS).title()} {rng.choice(load_suite.TITLE_WORDS)} {i}",
+        "director": rng.choice(load_suite.DIRECTORS),
+        "year": rng.randint(1901, 2024),
+        "rating": round(rng.uniform(0, 10), 1),
+    } for i in range(count)]
+
+
+def review_rows(count, rng):
+    start = datetime(2024, 1, 1)
+    return [{
+        "film_id": rng.randint(1, 1000),
+        "user_id": rng.randint(1, 1000),
+        "text": f"Review number {i} with some words about the movie",
+        "rating": rng.randint(1, 10),
+        # Every other timestamp has microseconds, which both encoders must write the same way
+        "created_at": start + timedelta(seconds=i, microseconds=(i % 2) * rng.randint(1, 999_999)),
+        "is_approved": rng.random() < 0.5,
+    } for i in range(count)]
+
+
+def user_rows(count, rng):
+    return [{
+        "email": f"user{i}@bench",
+        "full_name": f"Bench User {i}" if i % 3 else None,
+        "is_active": i % 7 != 0,
+        "bio": "Кинолюб, смотрю всё подряд" if i % 2 else None,
+        "birthdate": datetime(1950, 1, 1).date() + timedelta(days=rng.randint(0, 20000)),
+        "phone_number": None,
+        "address": None,
+    } for i in range(count)]
+
+
+SEEDS = {"films": ("models.films", "Film", film_rows),
+         "reviews": ("models.reviews", "Review", review_rows),
+         "users": ("models.users", "User", user_rows)}
+
+
+async def seed(service, count):
+    from sqlalchemy import insert
+
+    module, model_name, make_rows = SEEDS[service.name]
+    model = getattr(service.modules[module], model_name)
+    rows = make_rows(count, random.Random(0))
+    async with service.modules["database.db"].open_session() as session:
+        for i in range(0, len(rows), 1000):
+            await session.exec(insert(model).values(rows[i:i + 1000]))
+        await session.commit()
+
+
+def canonical(body: bytes) -> str:
+    # Sorting keys keeps the types: 3 and 3.0, or a date and its string, still differ
+    return json.dumps(json.loads(body), sort_keys=True)
+
+
+async def request(service, client, path, fast, **params):
+    main = service.modules["main"]
+    main.FAST_LIST_RESPONSES = fast
+    if hasattr(main, "film_cache"):
+        # Otherwise every request after the first is answered from the response cache
+        main.film_cache.invalidate()
+    started = time.process_time()
+    r = await client.get(path, params=params)
+    elapsed = time.process_time() - started
+    r.raise_for_status()
+    return r, elapsed
+
+
+async def measure(service, rows, repeat):
+    import httpx
+
+    path = LISTINGS[service.name]
+    transport = httpx.ASGITransport(app=service.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://service", timeout=120) as client:
+        bodies, cpu = {}, {}
+        for fast in (False, True):
+            r, _ = await request(service, client, path, fast, unbounded="true")
+            bodies[fast] = canonical(r.content)
+            samples = [(await request(service, client, path, fast, unbounded="true"))[1] for _ in range(repeat)]
+            cpu[fast] = statistics.median(samples) * 1000 * 10_000 / rows
+
+        # One page through each path: same rows, same cursor
+        pages = {fast: (await request(service, client, path, fast, limit=100))[0] for fast in (False, True)}
+
+    cursors = [pages[fast].headers.get(NEXT_CURSOR_HEADER) for fast in (False, True)]
+    page_bodies = [canonical(pages[fast].content) for fast in (False, True)]
+    return {
+        "rows": len(json.loads(bodies[False])),
+        "model_path_cpu_ms_per_10k": round(cpu[False], 2),
+        "fast_path_cpu_ms_per_10k": round(cpu[True], 2),
+        "speedup": round(cpu[False] / cpu[True], 2) if cpu[True] else None,
+        "same_body": bodies[False] == bodies[True],
+        "same_page": page_bodies[0] == page_bodies[1] and cursors[0] == cursors[1],
+    }
+
+
+async def run(args):
+    scratch = tempfile.mkdtemp(prefix="serialization-")
+    report = {}
+    for name in args.services:
+        service = await load_suite.load_service(name, *load_suite.database_urls(None, name, scratch))
+        try:
+            await seed(service, args.rows)
+            report[name] = await measure(service, args.rows, args.repeat)
+        finally:
+            await service.lifespan.shutdown()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--services", nargs="+", default=list(LISTINGS), choices=LISTINGS)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    # Read by the services at import time; the outbox relays have nobody to publish to here
+    os.environ.setdefault("SECRET_KEY", "serialization-benchmark-secret")
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+    os.environ["EVENT_SUBSCRIBERS"] = ""
+    os.environ["ADMISSION_ENABLED"] = "false"
+
+    report = asyncio.run(run(args))
+    try:
+        import orjson
+        encoder = f"orjson {orjson.__version__}"
+    except ImportError:
+        encoder = "json (orjson is not installed)"
+    failures = [name for name, result in report.items()
+                if not (result["same_body"] and result["same_page"])]
+    output = json.dumps({"encoder": encoder, "results": report, "failures": failures}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
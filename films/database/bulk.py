@@ -0,0 +1,30 @@
+from sqlalchemy import insert
+from typing import List
+from database.db import DB_MODE, async_engine
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# "copy" uses PostgreSQL COPY when running on asyncpg, "insert" always uses multi-row INSERT
+IMPORT_METHOD = os.getenv("IMPORT_METHOD", "copy")
+
+
+def copy_supported() -> bool:
+    return IMPORT_METHOD == "copy" and DB_MODE == "async" and async_engine.dialect.driver == "asyncpg"
+
+
+async def insert_rows(session, model, rows: List[dict]) -> None:
+    if not rows:
+        return
+    if copy_supported():
+        columns = list(rows[0])
+        connection = await session.connection()
+        raw = await connection.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            model.__tablename__,
+            records=[tuple(row[column] for column in columns) for row in rows],
+            columns=columns,
+        )
+    else:
+        await session.execute(insert(model), rows)
@@ -0,0 +1,23 @@
+from sqlalchemy import insert, literal, select
+from models.films import Film
+from models.outbox import OutboxEvent
+from database.search import ensure_search_indexes
+
+
+def initial_schema(connection) -> None:
+    # checkfirst keeps this safe on databases created before migrations existed
+    Film.__table__.metadata.create_all(connection)
+
+
+def outbox(connection) -> None:
+    OutboxEvent.__table__.create(connection, checkfirst=True)
+    # Subscribers learn about the movies that existed before the outbox from these events
+    existing = select(literal("film"), literal("created"), Film.id)
+    connection.execute(insert(OutboxEvent).from_select(["kind", "event", "entity_id"], existing))
+
+
+MIGRATIONS = [
+    (1, "Initial schema", initial_schema),
+    (2, "Full-text and trigram search indexes", ensure_search_indexes),
+    (3, "Transactional outbox for film events", outbox),
+]
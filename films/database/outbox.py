@@ -0,0 +1,158 @@
+from sqlalchemy import delete, func, insert, literal, select, text, update
+from datetime import datetime, timedelta
+from typing import List, Optional
+from models.outbox import OutboxEvent
+from database.db import engine, open_session
+from clients.http import upstreams
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+CREATED, DELETED = "created", "deleted"
+
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+# Published events are kept this many seconds for inspection, then pruned
+OUTBOX_RETENTION = float(os.getenv("OUTBOX_RETENTION", "86400"))
+OUTBOX_PRUNE_INTERVAL = 60
+# Upstreams from clients/http.py that receive every event on POST /internal/events
+EVENT_SUBSCRIBERS = [name.strip() for name in os.getenv("EVENT_SUBSCRIBERS", "reviews").split(",") if name.strip()]
+# Sent to the subscribers in EVENTS_SECRET_HEADER; must match their EVENTS_SECRET
+EVENTS_SECRET = os.getenv("EVENTS_SECRET", "")
+EVENTS_SECRET_HEADER = "X-Events-Secret"
+OUTBOX_LOCK_KEY = 7_301_147
+
+
+def record_event(session, kind: str, event: str, entity_id: int) -> None:
+    # Added to the caller's session, so the event commits or rolls back with the change itself
+    session.add(OutboxEvent(kind=kind, event=event, entity_id=entity_id))
+
+
+async def record_created_after(session, model, kind: str, after_id: int) -> None:
+    # Bulk inserts do not return IDs (COPY), so the events are copied from the new rows.
+    # IDs committed meanwhile by others may be recorded twice, which consumers tolerate
+    rows = select(literal(kind), literal(CREATED), model.id).where(model.id > after_id)
+    await session.execute(insert(OutboxEvent).from_select(["kind", "event", "entity_id"], rows))
+
+
+async def max_id(session, model) -> int:
+    return (await session.execute(select(func.coalesce(func.max(model.id), 0)))).scalar_one()
+
+
+class OutboxRelay:
+    """Publishes committed outbox events to the subscribers, oldest first and at least once.
+
+    Writers call notify() after committing, so events go out at once; the poll interval only
+    bounds the delay when a notification was missed or a subscriber was down.
+    """
+
+    def __init__(self, subscribers: Optional[List[str]] = None, batch_size: int = OUTBOX_BATCH_SIZE,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL):
+        self.subscribers = EVENT_SUBSCRIBERS if subscribers is None else subscribers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.published = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._pruned_at = 0.0
+
+    async def start(self) -> None:
+        if self.subscribers and self._task is None:
+            if not EVENTS_SECRET:
+                logger.warning("EVENTS_SECRET is not set, subscribers will refuse the outbox events")
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                sent = await self.publish_pending()
+                if sent == self.batch_size:
+                    continue
+                if time.monotonic() - self._pruned_at >= OUTBOX_PRUNE_INTERVAL:
+                    await self.prune()
+            except Exception as e:
+                self.failures += 1
+                self.last_error = f"{type(e).__name__}: {str(e)}"
+                logger.warning(f"Outbox relay failed, retrying in {self.poll_interval}s: {self.last_error}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def publish_pending(self) -> int:
+        async with open_session() as session:
+            if engine.dialect.name == "postgresql":
+                # One relay per database publishes at a time; the lock is released on commit
+                locked = await session.execute(text("SELECT pg_try_advisory_xact_lock(:key)"),
+                                               {"key": OUTBOX_LOCK_KEY})
+                if not locked.scalar():
+                    return 0
+
+            pending = (await session.execute(
+                select(OutboxEvent).where(OutboxEvent.published_at.is_(None))
+                .order_by(OutboxEvent.id).limit(self.batch_size)
+            )).scalars().all()
+            if not pending:
+                return 0
+
+            # Subscribers refuse IDs below 1 (clients may choose them on create); sending one would
+            # fail the whole batch on every retry and hold up all later events
+            payload = {"events": [
+                {"id": event.id, "kind": event.kind, "type": event.event, "entity_id": event.entity_id}
+                for event in pending if event.entity_id > 0
+            ]}
+            headers = {EVENTS_SECRET_HEADER: EVENTS_SECRET}
+            for subscriber in self.subscribers if payload["events"] else ():
+                r = await upstreams.request(subscriber, "POST", "/internal/events", idempotent=True,
+                                            json=payload, headers=headers)
+                if r.status_code >= 300:
+                    raise RuntimeError(f"{subscriber} answered {r.status_code}")
+
+            await session.execute(
+                update(OutboxEvent)
+                .where(OutboxEvent.id.in_([event.id for event in pending]))
+                .values(published_at=datetime.utcnow())
+            )
+            await session.commit()
+
+        self.published += len(pending)
+        logger.debug("Published %d outbox events up to ID %d", len(pending), pending[-1].id)
+        return len(pending)
+
+    async def prune(self) -> None:
+        self._pruned_at = time.monotonic()
+        cutoff = datetime.utcnow() - timedelta(seconds=OUTBOX_RETENTION)
+        async with open_session() as session:
+            await session.execute(delete(OutboxEvent).where(OutboxEvent.published_at < cutoff))
+            await session.commit()
+
+    async def stats(self) -> dict:
+        async with open_session() as session:
+            pending = (await session.execute(
+                select(func.count()).select_from(OutboxEvent).where(OutboxEvent.published_at.is_(None))
+            )).scalar_one()
+        return {
+            "subscribers": self.subscribers,
+            "pending": pending,
+            "published": self.published,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+outbox_relay = OutboxRelay()
@@ -0,0 +1,64 @@
+from sqlalchemy import func, literal, literal_column, or_
+from sqlmodel import select
+from typing import List, Optional
+from models.films import FILM_SEARCH_DOCUMENT, PG_TRGM_EXTENSION, Film
+from database.db import engine
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+document = literal_column(FILM_SEARCH_DOCUMENT)
+
+
+def build_tsquery(q: str) -> Optional[str]:
+    # "star wa" -> "star:* & wa:*" so the last, partially typed word still matches
+    tokens = re.findall(r"\w+", q.lower())
+    if not tokens:
+        return None
+    return " & ".join(f"{token}:*" for token in tokens)
+
+
+def search_statement(q: str, limit: int, offset: int):
+    if engine.dialect.name != "postgresql":
+        # Stand-in databases have no tsvector or pg_trgm, fall back to a plain scan
+        pattern = f"%{q}%"
+        return (
+            select(Film)
+            .where(or_(Film.title.ilike(pattern), Film.director.ilike(pattern)))
+            .order_by(Film.id)
+            .limit(limit)
+            .offset(offset)
+        )
+
+    tsquery = func.to_tsquery(literal_column("'simple'"), build_tsquery(q) or "")
+    term = literal(q)
+    score = func.ts_rank(document, tsquery) + func.greatest(
+        func.word_similarity(term, Film.title),
+        func.word_similarity(term, Film.director),
+    )
+    return (
+        select(Film)
+        .where(or_(
+            document.op("@@")(tsquery),
+            term.op("<%")(Film.title),
+            term.op("<%")(Film.director),
+        ))
+        .order_by(score.desc(), Film.id)
+        .limit(limit)
+        .offset(offset)
+    )
+
+
+async def search_films(session, q: str, limit: int, offset: int) -> List[Film]:
+    if build_tsquery(q) is None:
+        return []
+    return list((await session.exec(search_statement(q, limit, offset))).all())
+
+
+def ensure_search_indexes(connection) -> None:
+    # Databases created before the indexes were declared on the model get them here
+    PG_TRGM_EXTENSION(Film.__table__, connection)
+    for index in Film.__table__.indexes:
+        index.create(connection, checkfirst=True)
+    logger.info("Search indexes are in place")
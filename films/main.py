@@ -1,13 +1,35 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Header
-from fastapi.responses import JSONResponse
-from sqlmodel import select, Session
-from typing import List
-from models.films import Film
-from database.db import get_session, wait_for_db
-import httpx
+from fastapi import FastAPI, Depends, HTTPException, status, Header, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import List, Optional
+from models.films import Film, FilmBatchRequest, FilmBatchResponse, FilmImportError, FilmImportReport
+from database.db import (apply_migrations, async_engine, engine, get_session, open_session, ping_db, stream_scalars,
+                         wait_for_db)
+from database.migrations import MIGRATIONS
+from database.pool import pool_stats
+from observability.health import Startup, setup_health
+from observability.log import setup_logging
+from observability.metrics import setup_metrics
+from observability.profiling import setup_profiling
+from middleware.admission import setup_admission
+from database.bulk import insert_rows
+from database.outbox import CREATED, DELETED, max_id, outbox_relay, record_created_after, record_event
+from database.search import search_films
+from security.tokens import verify_token
+from clients.http import upstreams
+from utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, decode_cursor, paginate
+from utils.response_cache import CachedResponse, ResponseCache, render
+from utils.fast_json import FAST_LIST_RESPONSES, model_columns, render_rows
+from utils.singleflight import SingleFlight
+from utils.bulk_import import iter_csv_rows, iter_ndjson_rows, validate_row
+import asyncio
+import json
 import logging
+import os
 
-logging.basicConfig(level=logging.INFO)
+setup_logging(engine, async_engine)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(
@@ -15,13 +37,63 @@ app = FastAPI(
     description="API for managing films list",
     version="1.0.0"
 )
+setup_metrics(app, engine, async_engine)
+setup_profiling(app, engine, async_engine)
+setup_admission(app)
+
+startup = Startup(
+    ("database", wait_for_db),
+    ("migrations", lambda: apply_migrations(MIGRATIONS)),
+    ("outbox", outbox_relay.start),
+)
+setup_health(app, startup, ping_db)
+
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "500"))
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+SEARCH_MAX_OFFSET = int(os.getenv("SEARCH_MAX_OFFSET", "1000"))
+
+film_cache = ResponseCache()
+film_reads = SingleFlight("films")
 
 
 @app.on_event("startup")
 async def startup_event():
     logger.info("Launching the movie service...")
-    wait_for_db()
-    logger.info("The service is ready to work")
+    startup.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await startup.cancel()
+    await outbox_relay.stop()
+    await upstreams.aclose()
+
+
+@app.get("/internal/db-pool", include_in_schema=False)
+async def db_pool_stats():
+    return {"sync": pool_stats(engine), "async": pool_stats(async_engine)}
+
+
+@app.get("/internal/http-pool", include_in_schema=False)
+async def http_pool_stats():
+    return upstreams.stats()
+
+
+@app.get("/internal/response-cache", include_in_schema=False)
+async def response_cache_stats():
+    return film_cache.stats()
+
+
+@app.get("/internal/outbox", include_in_schema=False)
+async def outbox_stats():
+    return await outbox_relay.stats()
+
+
+@app.get("/internal/coalescing", include_in_schema=False)
+async def coalescing_stats():
+    return film_reads.stats()
 
 
 @app.post("/films",
@@ -32,25 +104,22 @@ async def startup_event():
 async def create_film(
         film: Film,
         token: str = Header(..., alias="Authorization"),
-        session: Session = Depends(get_session)
+        session: AsyncSession = Depends(get_session)
 ):
-    token = token.replace("Bearer ", "").strip()
-    async with httpx.AsyncClient() as client:
-        r = await client.post(
-            "http://auth:8001/verify",
-            headers={"Authorization": f"Bearer {token}"}
-        )
-    if r.status_code != 200:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    await verify_token(token)
 
     try:
         session.add(film)
-        session.commit()
-        session.refresh(film)
+        await session.flush()
+        record_event(session, "film", CREATED, film.id)
+        await session.commit()
+        await session.refresh(film)
+        film_cache.invalidate()
+        outbox_relay.notify()
         logger.info(f"A new movie has been added: ID {film.id}, {film.title}")
         return film
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         logger.error(f"Error when adding a movie: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -58,13 +127,165 @@ async def create_film(
         )
 
 
+async def _load_import_batch(session: AsyncSession, rows: List[dict], lines: List[int],
+                             errors: List[FilmImportError]) -> int:
+    try:
+        after_id = await max_id(session, Film)
+        await insert_rows(session, Film, rows)
+        await record_created_after(session, Film, "film", after_id)
+        await session.commit()
+        return len(rows)
+    except Exception as e:
+        await session.rollback()
+        logger.error(f"Error when importing movies on lines {lines[0]}-{lines[-1]}: {str(e)}")
+        errors.extend(
+            FilmImportError(line=line, errors=[{"field": "", "message": "Couldn't save the movie"}])
+            for line in lines
+        )
+        return 0
+
+
+@app.post("/films/import",
+          response_model=FilmImportReport,
+          summary="Bulk import movies from NDJSON or CSV",
+          response_description="How many movies were imported and why the rest were rejected")
+async def import_films(
+        request: Request,
+        token: str = Header(..., alias="Authorization"),
+        session: AsyncSession = Depends(get_session)
+):
+    await verify_token(token)
+
+    read_rows = iter_csv_rows if "csv" in request.headers.get("content-type", "") else iter_ndjson_rows
+    imported = 0
+    errors: List[FilmImportError] = []
+    rows: List[dict] = []
+    lines: List[int] = []
+
+    async for line_no, row in read_rows(request.stream()):
+        if isinstance(row, ValueError):
+            errors.append(FilmImportError(line=line_no, errors=[{"field": "", "message": str(row)}]))
+            continue
+
+        film, row_errors = validate_row(Film, row)
+        if row_errors:
+            errors.append(FilmImportError(line=line_no, errors=row_errors))
+            continue
+
+        rows.append(film)
+        lines.append(line_no)
+        if len(rows) >= IMPORT_BATCH_SIZE:
+            imported += await _load_import_batch(session, rows, lines, errors)
+            rows, lines = [], []
+
+    imported += await _load_import_batch(session, rows, lines, errors)
+    film_cache.invalidate()
+    outbox_relay.notify()
+    logger.info(f"Movie import finished: {imported} imported, {len(errors)} rejected")
+    return FilmImportReport(imported=imported, failed=len(errors), errors=errors[:IMPORT_MAX_ERRORS])
+
+
+def _render_films(films: list, headers: Optional[dict] = None) -> CachedResponse:
+    if FAST_LIST_RESPONSES:
+        return CachedResponse(render_rows(Film, films), headers)
+    return render(films, headers)
+
+
 @app.get("/films",
          response_model=List[Film],
          summary="Get a list of all movies")
-async def read_films(session: Session = Depends(get_session)):
-    films = session.exec(select(Film)).all()
-    logger.info(f"A list of films was requested, {len(films)} entries were found")
-    return films
+async def read_films(
+        request: Request,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        unbounded: bool = Query(False, description="Return every movie in one response"),
+        session: AsyncSession = Depends(get_session)
+):
+    generation = film_cache.generation
+    key = ("films", generation, unbounded) if unbounded else ("films", generation, limit, cursor)
+    cached = film_cache.lookup(key)
+    if cached is not None:
+        return cached.to_response(request)
+
+    # The fast path fetches plain column tuples and encodes them directly
+    query = select(*model_columns(Film)) if FAST_LIST_RESPONSES else select(Film)
+    query = query.order_by(Film.id)
+    if unbounded:
+        films = (await session.exec(query)).all()
+        logger.debug("A list of films was requested, %d entries were found", len(films))
+        return film_cache.store(key, generation, _render_films(films)).to_response(request)
+
+    if cursor:
+        last_id, = decode_cursor(cursor, (int,))
+        query = query.where(Film.id > last_id)
+    rows = (await session.exec(query.limit(limit + 1))).all()
+    films, next_cursor = paginate(rows, limit, key=lambda film: (film.id,))
+    logger.debug("A page of films was requested, %d entries were found", len(films))
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+    return film_cache.store(key, generation, _render_films(films, headers)).to_response(request)
+
+
+@app.post("/films/batch",
+          response_model=FilmBatchResponse,
+          summary="Get several movies by ID",
+          responses={
+              400: {"description": "Too many IDs requested"}
+          })
+async def read_films_batch(
+        batch: FilmBatchRequest,
+        session: AsyncSession = Depends(get_session)
+):
+    ids = list(dict.fromkeys(batch.ids))
+    if len(ids) > BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {BATCH_MAX_SIZE} IDs can be requested at once"
+        )
+
+    films = (await session.exec(select(Film).where(Film.id.in_(ids)))).all() if ids else []
+    found = {film.id: film for film in films}
+    return FilmBatchResponse(
+        films=[found[film_id] for film_id in ids if film_id in found],
+        missing=[film_id for film_id in ids if film_id not in found]
+    )
+
+
+@app.get("/films/export",
+         summary="Export all movies as NDJSON",
+         response_class=StreamingResponse,
+         responses={
+             200: {"content": {"application/x-ndjson": {}}}
+         })
+async def export_films(since_id: int = Query(0, ge=0, description="Resume after this movie ID")):
+    async def ndjson():
+        query = select(Film).where(Film.id > since_id).order_by(Film.id)
+        async for chunk in stream_scalars(query, EXPORT_CHUNK_SIZE):
+            yield "".join(json.dumps(jsonable_encoder(film)) + "\n" for film in chunk)
+
+    logger.info(f"Movie export requested from ID {since_id}")
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@app.get("/films/search",
+         response_model=List[Film],
+         summary="Search movies by title and director",
+         response_description="Movies ordered by relevance")
+async def search(
+        q: str = Query(..., min_length=1, max_length=200),
+        limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+        offset: int = Query(0, ge=0, le=SEARCH_MAX_OFFSET),
+        session: AsyncSession = Depends(get_session)
+):
+    return await search_films(session, q, limit, offset)
+
+
+async def _load_film(film_id: int) -> Optional[CachedResponse]:
+    async with open_session() as session:
+        film = await session.get(Film, film_id)
+    if not film:
+        return None
+    logger.debug("Movie ID requested %d: %s", film_id, film.title)
+    return render(film)
 
 
 @app.get("/films/{film_id}",
@@ -73,16 +294,28 @@ async def read_films(session: Session = Depends(get_session)):
          responses={
              404: {"description": "The movie was not found"}
          })
-async def read_film(film_id: int, session: Session = Depends(get_session)):
-    film = session.get(Film, film_id)
-    if not film:
+async def read_film(film_id: int, request: Request):
+    key = ("film", film_id)
+    cached = film_cache.lookup(key)
+    if cached is not None:
+        return cached.to_response(request)
+
+    # Concurrent misses for one movie share a single lookup and its rendered body
+    generation = film_cache.generation
+    try:
+        rendered = await film_reads.do(film_id, lambda: _load_film(film_id))
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Timed out loading the movie"
+        )
+    if rendered is None:
         logger.warning(f"A non-existent movie ID was requested {film_id}")
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="The movie was not found"
         )
-    logger.info(f"Movie ID requested{film_id}: {film.title}")
-    return film
+    return film_cache.store(key, generation, rendered).to_response(request)
 
 
 @app.put("/films/{film_id}",
@@ -95,17 +328,11 @@ async def update_film(
         film_id: int,
         film_data: Film,
         token: str = Header(..., alias="Authorization"),
-        session: Session = Depends(get_session)
+        session: AsyncSession = Depends(get_session)
 ):
-    async with httpx.AsyncClient() as client:
-        r = await client.post(
-            "http://auth:8001/verify",
-            headers={"Authorization": f"Bearer {token}"}
-        )
-    if r.status_code != 200:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    await verify_token(token)
 
-    film = session.get(Film, film_id)
+    film = await session.get(Film, film_id)
     if not film:
         logger.warning(f"Attempt to update a non-existent movie ID {film_id}")
         raise HTTPException(
@@ -118,8 +345,10 @@ async def update_film(
         setattr(film, field, value)
 
     session.add(film)
-    session.commit()
-    session.refresh(film)
+    await session.commit()
+    await session.refresh(film)
+    film_cache.invalidate(("film", film_id))
+    film_reads.forget(film_id)
 
     logger.info(f"Updated movie ID {film_id}: {film.title}")
     return film
@@ -135,17 +364,11 @@ async def update_film(
 async def delete_film(
         film_id: int,
         token: str = Header(..., alias="Authorization"),
-        session: Session = Depends(get_session)
+        session: AsyncSession = Depends(get_session)
 ):
-    async with httpx.AsyncClient() as client:
-        r = await client.post(
-            "http://auth:8001/verify",
-            headers={"Authorization": f"Bearer {token}"}
-        )
-    if r.status_code != 200:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    await verify_token(token)
 
-    film = session.get(Film, film_id)
+    film = await session.get(Film, film_id)
     if not film:
         logger.warning(f"Attempt to delete a non-existent movie ID {film_id}")
         raise HTTPException(
@@ -153,8 +376,12 @@ async def delete_film(
             detail="The movie was not found"
         )
 
-    session.delete(film)
-    session.commit()
+    await session.delete(film)
+    record_event(session, "film", DELETED, film_id)
+    await session.commit()
+    film_cache.invalidate(("film", film_id))
+    film_reads.forget(film_id)
+    outbox_relay.notify()
 
     logger.info(f"Deleted movie ID {film_id}: {film.title}")
     return JSONResponse(
@@ -0,0 +1,231 @@
+from collections import deque
+from fastapi import FastAPI
+from observability.metrics import ADMISSION_QUEUE_WAIT, ADMISSION_REJECTED
+from starlette.routing import Match
+from typing import Deque, Dict, Optional, Tuple
+import asyncio
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+READ, WRITE = "read", "write"
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Requests in progress across all routes; writes may hold at most ADMISSION_WRITE_SHARE of
+# them, so a burst of expensive writes always leaves room for reads
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "128"))
+ADMISSION_WRITE_SHARE = float(os.getenv("ADMISSION_WRITE_SHARE", "0.5"))
+# Per-route limits; ADMISSION_ROUTE_LIMITS overrides single routes, e.g. "POST /register=4,GET /films=32"
+ADMISSION_READ_LIMIT = int(os.getenv("ADMISSION_READ_LIMIT", "64"))
+ADMISSION_WRITE_LIMIT = int(os.getenv("ADMISSION_WRITE_LIMIT", "16"))
+ADMISSION_ROUTE_LIMITS = os.getenv("ADMISSION_ROUTE_LIMITS", "")
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+# A request that cannot start within this long is better answered with a 503 than served late
+ADMISSION_READ_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_READ_QUEUE_TIMEOUT", "1"))
+ADMISSION_WRITE_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_WRITE_QUEUE_TIMEOUT", "0.5"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+# POST endpoints that only read, so they are scheduled with the GETs
+ADMISSION_READ_ROUTES = os.getenv("ADMISSION_READ_ROUTES", "POST /verify,POST /films/batch,POST /users/batch")
+# Probes, scrapes and the limiter's own stats must keep answering while the service sheds load.
+# Other internal endpoints are admitted like any route: POST /internal/events does real writes
+BYPASS_PREFIXES = ("/health/", "/metrics", "/internal/admission", "/docs", "/openapi.json")
+
+
+def _parse_limits(value: str) -> Dict[str, int]:
+    limits = {}
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        route, limit = entry.rsplit("=", 1)
+        limits[route.strip()] = int(limit)
+    return limits
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Limiter:
+    """A concurrency limit with a bounded FIFO wait queue per priority.
+
+    Freed slots go to waiting reads before waiting writes, and writes never hold more
+    than write_limit slots.
+    """
+
+    def __init__(self, limit: int, queue_size: int, write_limit: Optional[int] = None):
+        self.limit = limit
+        self.write_limit = limit if write_limit is None else write_limit
+        self.queue_size = queue_size
+        self.active = {READ: 0, WRITE: 0}
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {READ: deque(), WRITE: deque()}
+
+    def _can_start(self, priority: str) -> bool:
+        if self.active[READ] + self.active[WRITE] >= self.limit:
+            return False
+        return priority == READ or self.active[WRITE] < self.write_limit
+
+    def _queued(self) -> int:
+        return len(self._waiters[READ]) + len(self._waiters[WRITE])
+
+    async def acquire(self, priority: str, timeout: float) -> None:
+        # Nobody may overtake waiters of the same or a higher priority
+        ahead = self._waiters[READ] if priority == READ else self._queued()
+        if not ahead and self._can_start(priority):
+            self.active[priority] += 1
+            return
+        if timeout <= 0:
+            raise Rejected("queue_timeout")
+        if self._queued() >= self.queue_size:
+            raise Rejected("queue_full")
+
+        waiters = self._waiters[priority]
+        waiter = asyncio.get_running_loop().create_future()
+        waiters.append(waiter)
+        try:
+            # release() counts the slot as taken when it wakes the waiter
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            self._forget(waiters, waiter)
+            raise Rejected("queue_timeout")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(priority)
+            else:
+                self._forget(waiters, waiter)
+            raise
+
+    @staticmethod
+    def _forget(waiters: Deque[asyncio.Future], waiter: asyncio.Future) -> None:
+        try:
+            waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self, priority: str) -> None:
+        self.active[priority] -= 1
+        for waiting in (READ, WRITE):
+            waiters = self._waiters[waiting]
+            while waiters and self._can_start(waiting):
+                waiter = waiters.popleft()
+                if not waiter.done():
+                    self.active[waiting] += 1
+                    waiter.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": dict(self.active),
+            "queued": {priority: len(waiters) for priority, waiters in self._waiters.items()},
+        }
+
+
+class AdmissionControl:
+    """The service-wide limiter plus one limiter per route, created on first use."""
+
+    def __init__(self):
+        self.service = Limiter(
+            ADMISSION_MAX_CONCURRENCY, ADMISSION_QUEUE_SIZE,
+            write_limit=max(1, int(ADMISSION_MAX_CONCURRENCY * ADMISSION_WRITE_SHARE)),
+        )
+        self.routes: Dict[str, Tuple[Limiter, str]] = {}
+        self.overrides = _parse_limits(ADMISSION_ROUTE_LIMITS)
+        self.read_routes = {route.strip() for route in ADMISSION_READ_ROUTES.split(",") if route.strip()}
+
+    def route(self, key: str, method: str) -> Tuple[Limiter, str]:
+        entry = self.routes.get(key)
+        if entry is None:
+            priority = READ if method in ("GET", "HEAD") or key in self.read_routes else WRITE
+            default = ADMISSION_READ_LIMIT if priority == READ else ADMISSION_WRITE_LIMIT
+            entry = self.routes[key] = (Limiter(self.overrides.get(key, default), ADMISSION_QUEUE_SIZE), priority)
+        return entry
+
+    def stats(self) -> dict:
+        return {
+            "service": self.service.stats(),
+            "routes": {key: {**limiter.stats(), "priority": priority} for key, (limiter, priority) in self.routes.items()},
+        }
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware that sheds excess requests with 503 before they reach a session.
+
+    A request first waits for a slot on its route, then for one of the service-wide slots;
+    both waits share the queue-time deadline of its priority.
+    """
+
+    def __init__(self, app, router, control: AdmissionControl):
+        self.app = app
+        self.router = router
+        self.control = control
+
+    def _match(self, scope) -> Optional[str]:
+        for route in self.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(BYPASS_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+        path = self._match(scope)
+        if path is None:
+            await self.app(scope, receive, send)
+            return
+
+        key = f"{scope['method']} {path}"
+        route, priority = self.control.route(key, scope["method"])
+        service = self.control.service
+        timeout = ADMISSION_READ_QUEUE_TIMEOUT if priority == READ else ADMISSION_WRITE_QUEUE_TIMEOUT
+        started = time.perf_counter()
+        try:
+            await route.acquire(priority, timeout)
+        except Rejected as e:
+            await self._reject(key, e.reason, send)
+            return
+        try:
+            try:
+                await service.acquire(priority, timeout - (time.perf_counter() - started))
+            except Rejected as e:
+                await self._reject(key, e.reason, send)
+                return
+            ADMISSION_QUEUE_WAIT.labels(priority).observe(time.perf_counter() - started)
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                service.release(priority)
+        finally:
+            route.release(priority)
+
+    @staticmethod
+    async def _reject(key: str, reason: str, send) -> None:
+        ADMISSION_REJECTED.labels(key, reason).inc()
+        logger.debug("Shed %s: %s", key, reason)
+        body = json.dumps({"detail": "The service is overloaded, retry later"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(ADMISSION_RETRY_AFTER).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def setup_admission(app: FastAPI) -> None:
+    # Call after the other setup_* helpers: the last middleware added is the outermost one,
+    # so excess requests are shed before metrics, profiling or the router do any work
+    if not ADMISSION_ENABLED:
+        return
+    control = AdmissionControl()
+    app.add_middleware(AdmissionMiddleware, router=app.router, control=control)
+
+    @app.get("/internal/admission", include_in_schema=False)
+    async def admission_stats():
+        return control.stats()
@@ -1,9 +1,47 @@
 from sqlmodel import SQLModel, Field
+from sqlalchemy import DDL, Index, event, text
+from typing import List
+
+# database/search.py queries this exact expression, otherwise the planner ignores the index
+FILM_SEARCH_DOCUMENT = "to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(director, ''))"
 
 
 class Film(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_film_search_document", text(FILM_SEARCH_DOCUMENT),
+              postgresql_using="gin").ddl_if(dialect="postgresql"),
+        Index("ix_film_title_trgm", "title",
+              postgresql_using="gin", postgresql_ops={"title": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+        Index("ix_film_director_trgm", "director",
+              postgresql_using="gin", postgresql_ops={"director": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
     title: str = Field(index=True)
     director: str
     year: int = Field(gt=1900)
     rating: float = Field(ge=0, le=10)
+
+
+PG_TRGM_EXTENSION = DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+event.listen(Film.__table__, "before_create", PG_TRGM_EXTENSION)
+
+
+class FilmBatchRequest(SQLModel):
+    ids: List[int]
+
+
+class FilmBatchResponse(SQLModel):
+    films: List[Film]
+    missing: List[int]
+
+
+class FilmImportError(SQLModel):
+    line: int
+    errors: List[dict]
+
+
+class FilmImportReport(SQLModel):
+    imported: int
+    failed: int
+    errors: List[FilmImportError]
@@ -0,0 +1,22 @@
+from sqlmodel import SQLModel, Field
+from sqlalchemy import Index, func, text
+from datetime import datetime
+from typing import Optional
+
+
+class OutboxEvent(SQLModel, table=True):
+    """A create or delete, written in the same transaction as the change and published later."""
+
+    __tablename__ = "outbox_event"
+    # The relay only ever reads the unpublished tail
+    __table_args__ = (
+        Index("ix_outbox_event_pending", "id", postgresql_where=text("published_at IS NULL")),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str
+    event: str
+    entity_id: int
+    # The server default covers events copied straight from the rows by INSERT ... SELECT
+    created_at: datetime = Field(default_factory=datetime.utcnow, sa_column_kwargs={"server_default": func.now()})
+    published_at: Optional[datetime] = None
@@ -0,0 +1,149 @@
+from fastapi import FastAPI, Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from sqlalchemy import event
+import httpx
+import time
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Request latency by route",
+    ["method", "route"], buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests currently being handled",
+    ["method"],
+)
+RESPONSES = Counter(
+    "http_responses_total", "Responses by route and status code",
+    ["method", "route", "status"],
+)
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds", "SQL statement latency by statement type",
+    ["operation"], buckets=LATENCY_BUCKETS,
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection",
+    ["engine"], buckets=LATENCY_BUCKETS,
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections", "Pooled connections by state",
+    ["engine", "state"],
+)
+STARTUP_DURATION = Gauge(
+    "service_startup_seconds", "Time from import until the service became ready",
+    ["phase"],
+)
+UPSTREAM_LATENCY = Histogram(
+    "upstream_request_duration_seconds", "Outbound HTTP latency by upstream",
+    ["upstream", "method", "status"], buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_BREAKER_STATE = Gauge(
+    "upstream_circuit_state", "Circuit breaker state by upstream: 0 closed, 1 half-open, 2 open",
+    ["upstream"],
+)
+UPSTREAM_BREAKER_TRANSITIONS = Counter(
+    "upstream_circuit_transitions_total", "Circuit breaker state changes by upstream and new state",
+    ["upstream", "state"],
+)
+UPSTREAM_REJECTED = Counter(
+    "upstream_rejected_total", "Calls failed fast without reaching the upstream, by reason",
+    ["upstream", "reason"],
+)
+UPSTREAM_RETRIES = Counter(
+    "upstream_retries_total", "Retries by upstream; budget_exhausted counts the ones the budget refused",
+    ["upstream", "outcome"],
+)
+ADMISSION_QUEUE_WAIT = Histogram(
+    "admission_queue_wait_seconds", "Time admitted requests waited for a concurrency slot",
+    ["priority"], buckets=LATENCY_BUCKETS,
+)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total", "Requests shed with 503 by route and reason",
+    ["route", "reason"],
+)
+# followers / (leaders + followers) is the share of reads served by a lookup already in flight
+COALESCED_READS = Counter(
+    "coalesced_reads_total", "Reads that started a lookup (leader) or joined one in flight (follower)",
+    ["name", "role"],
+)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so there is no per-request task or body buffering overhead."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        started = time.perf_counter()
+        # The route is only known once the router has matched, so in-flight is keyed by method
+        in_flight = REQUESTS_IN_FLIGHT.labels(method)
+        in_flight.inc()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_LATENCY.labels(method, route).observe(time.perf_counter() - started)
+            RESPONSES.labels(method, route, str(status_code)).inc()
+
+
+def instrument_engine(engine) -> None:
+    # Async engines emit cursor events from their underlying sync engine
+    kind = "async" if hasattr(engine, "sync_engine") else "sync"
+    engine = getattr(engine, "sync_engine", engine)
+
+    # Read at scrape time; the pool is looked up each time because dispose() replaces it
+    if hasattr(engine.pool, "checkedout"):
+        DB_POOL_CONNECTIONS.labels(kind, "checked_out").set_function(lambda: engine.pool.checkedout())
+        DB_POOL_CONNECTIONS.labels(kind, "checked_in").set_function(lambda: engine.pool.checkedin())
+        DB_POOL_CONNECTIONS.labels(kind, "overflow").set_function(lambda: max(0, engine.pool.overflow()))
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+        DB_QUERY_LATENCY.labels(operation).observe(time.perf_counter() - started)
+
+
+def instrument_client(client: httpx.AsyncClient, upstream: str) -> None:
+    async def on_request(request: httpx.Request):
+        request.extensions["metrics_started"] = time.perf_counter()
+
+    async def on_response(response: httpx.Response):
+        started = response.request.extensions.get("metrics_started")
+        if started is not None:
+            UPSTREAM_LATENCY.labels(upstream, response.request.method, str(response.status_code)).observe(
+                time.perf_counter() - started
+            )
+
+    client.event_hooks["request"].append(on_request)
+    client.event_hooks["response"].append(on_response)
+
+
+def setup_metrics(app: FastAPI, *engines) -> None:
+    app.add_middleware(MetricsMiddleware)
+    for engine in engines:
+        instrument_engine(engine)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,217 @@
+from collections import OrderedDict
+from contextvars import ContextVar
+from datetime import datetime
+from fastapi import FastAPI, Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+from typing import List, Optional
+import cProfile
+import hmac
+import httpx
+import io
+import logging
+import os
+import pstats
+import random
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Requests carrying this value in PROFILE_HEADER are profiled, and it also guards the
+# /internal/profiles endpoints; unset disables both the header and those endpoints
+PROFILING_SECRET = os.getenv("PROFILING_SECRET", "")
+# Fraction of all requests profiled without being asked, e.g. 0.001
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILE_STORE_SIZE = int(os.getenv("PROFILE_STORE_SIZE", "50"))
+PROFILE_TOP_FUNCTIONS = int(os.getenv("PROFILE_TOP_FUNCTIONS", "40"))
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+PROFILING_ENABLED = bool(PROFILING_SECRET) or PROFILING_SAMPLE_RATE > 0
+
+_current: ContextVar[Optional["RequestProfile"]] = ContextVar("request_profile", default=None)
+# cProfile can only hook one profiler per thread, so concurrent requests are not profiled
+_profiler_busy = False
+
+
+class RequestProfile:
+    __slots__ = ("id", "method", "path", "route", "status", "started_at", "wall_ms", "waits", "stats")
+
+    def __init__(self, method: str, path: str):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.route = None
+        self.status = None
+        self.started_at = datetime.utcnow()
+        self.wall_ms = 0.0
+        self.waits: List[dict] = []
+        self.stats = ""
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "wall_ms": round(self.wall_ms, 3),
+            "db_ms": round(sum(w["ms"] for w in self.waits if w["kind"] == "db"), 3),
+            "upstream_ms": round(sum(w["ms"] for w in self.waits if w["kind"] == "upstream"), 3),
+        }
+
+    def detail(self) -> dict:
+        return {**self.summary(), "waits": self.waits, "profile": self.stats}
+
+
+class ProfileStore:
+    """The most recent profiles, oldest evicted first."""
+
+    def __init__(self, maxsize: int = PROFILE_STORE_SIZE):
+        self.maxsize = maxsize
+        self.profiles: "OrderedDict[str, RequestProfile]" = OrderedDict()
+
+    def add(self, profile: RequestProfile) -> None:
+        self.profiles[profile.id] = profile
+        while len(self.profiles) > self.maxsize:
+            self.profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        return self.profiles.get(profile_id)
+
+    def list(self) -> List[dict]:
+        return [profile.summary() for profile in reversed(self.profiles.values())]
+
+
+profile_store = ProfileStore()
+
+
+def _secret_matches(value: Optional[str]) -> bool:
+    return (bool(PROFILING_SECRET) and value is not None
+            and hmac.compare_digest(value.encode(), PROFILING_SECRET.encode()))
+
+
+class ProfilingMiddleware:
+    """Runs selected requests under cProfile and records their DB and upstream waits.
+
+    cProfile sees everything executed on the event loop while the request is in flight,
+    so under load the call tree also contains other requests' work; the waits list is
+    exact because it is collected through a context variable.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def _wanted(self, scope) -> bool:
+        if scope["type"] != "http" or scope["path"].startswith("/internal/profiles"):
+            return False
+        for name, value in scope["headers"]:
+            if name == b"x-profile":
+                return _secret_matches(value.decode("latin-1"))
+        return PROFILING_SAMPLE_RATE > 0 and random.random() < PROFILING_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        global _profiler_busy
+        if _profiler_busy or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"])
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((PROFILE_ID_HEADER.lower().encode(), profile.id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        _profiler_busy = True
+        token = _current.set(profile)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.disable()
+            profile.wall_ms = (time.perf_counter() - started) * 1000
+            _current.reset(token)
+            _profiler_busy = False
+            profile.route = getattr(scope.get("route"), "path", None)
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+            profile.stats = out.getvalue()
+            profile_store.add(profile)
+            logger.info(f"Profiled {profile.method} {profile.path} in {profile.wall_ms:.1f} ms as {profile.id}")
+
+
+def _record_wait(kind: str, target: str, started: float) -> None:
+    profile = _current.get()
+    if profile is not None:
+        profile.waits.append({"kind": kind, "target": target, "ms": round((time.perf_counter() - started) * 1000, 3)})
+
+
+def _trace_engine(engine) -> None:
+    engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+        _record_wait("db", " ".join(statement.split())[:200], conn.info["profile_started"].pop())
+
+
+def trace_client(client: httpx.AsyncClient, upstream: str) -> None:
+    if not PROFILING_ENABLED:
+        return
+
+    async def on_request(request: httpx.Request):
+        request.extensions["profile_started"] = time.perf_counter()
+
+    async def on_response(response: httpx.Response):
+        started = response.request.extensions.get("profile_started")
+        if started is not None:
+            _record_wait("upstream", f"{upstream} {response.request.method} {response.request.url.path}", started)
+
+    client.event_hooks["request"].append(on_request)
+    client.event_hooks["response"].append(on_response)
+
+
+def _check_admin(secret: Optional[str]) -> None:
+    # Profiles include SQL text and request paths, so they are never served without the secret
+    if not _secret_matches(secret):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid profiling secret")
+
+
+def setup_profiling(app: FastAPI, *engines) -> None:
+    # Nothing is installed unless profiling is configured, so the disabled path costs nothing
+    if not PROFILING_ENABLED:
+        return
+    app.add_middleware(ProfilingMiddleware)
+    for engine in engines:
+        _trace_engine(engine)
+    logger.info(f"Request profiling enabled, sample rate {PROFILING_SAMPLE_RATE}")
+    if not PROFILING_SECRET:
+        logger.warning("PROFILING_SECRET is not set, the /internal/profiles endpoints are disabled")
+        return
+
+    @app.get("/internal/profiles", include_in_schema=False)
+    async def list_profiles(secret: Optional[str] = Header(None, alias=PROFILE_HEADER)):
+        _check_admin(secret)
+        return profile_store.list()
+
+    @app.get("/internal/profiles/{profile_id}", include_in_schema=False)
+    async def read_profile(profile_id: str, format: str = "json",
+                           secret: Optional[str] = Header(None, alias=PROFILE_HEADER)):
+        _check_admin(secret)
+        profile = profile_store.get(profile_id)
+        if profile is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="The profile was not found")
+        if format == "text":
+            return PlainTextResponse(profile.stats)
+        return profile.detail()
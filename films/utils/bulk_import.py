@@ -0,0 +1,123 @@
+from pydantic import ValidationError
+from typing import AsyncIterator, List, Optional, Tuple, Union
+import csv
+import json
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    # Lines stay undecoded, so one bad line is reported by the caller instead of ending the stream
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.rstrip(b"\r")
+    if buffer:
+        yield buffer.rstrip(b"\r")
+
+
+def decode_line(line: bytes) -> str:
+    try:
+        return line.decode("utf-8-sig")
+    except UnicodeDecodeError as e:
+        raise ValueError(f"The line is not valid UTF-8 (byte {e.start + 1})")
+
+
+def parse_ndjson(line: str) -> dict:
+    row = json.loads(line)
+    if not isinstance(row, dict):
+        raise ValueError("Each line must be a JSON object")
+    return row
+
+
+async def iter_ndjson_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Union[dict, ValueError]]]:
+    line_no = 0
+    async for line in iter_lines(chunks):
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            row = parse_ndjson(decode_line(line))
+        except ValueError as e:
+            row = e
+        yield line_no, row
+
+
+class _NeedMoreLines(Exception):
+    pass
+
+
+class CsvRecordReader:
+    """Feeds decoded lines to one csv.reader, which may need several of them for a quoted field."""
+
+    def __init__(self):
+        self.lines: List[str] = []
+        self._position = 0
+        self._reader = csv.reader(self)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if self._position == len(self.lines):
+            raise _NeedMoreLines
+        self._position += 1
+        return self.lines[self._position - 1]
+
+    def feed(self, line: str) -> Optional[List[str]]:
+        # The reader starts every record afresh, so until the record is complete it is asked
+        # again from the record's first line each time another line arrives
+        self.lines.append(line + "\n")
+        self._position = 0
+        try:
+            values = next(self._reader)
+        except _NeedMoreLines:
+            return None
+        except csv.Error as e:
+            self.lines = []
+            raise ValueError(str(e))
+        self.lines = []
+        return values
+
+
+async def iter_csv_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Union[dict, ValueError]]]:
+    # Rows are numbered by the line they start on; column names come from the first record
+    records = CsvRecordReader()
+    columns: Optional[List[str]] = None
+    line_no = start = 0
+    async for line in iter_lines(chunks):
+        line_no += 1
+        if not records.lines:
+            if not line.strip():
+                continue
+            start = line_no
+        try:
+            values = records.feed(decode_line(line))
+        except ValueError as e:
+            # Whatever was read of the record goes with it
+            records.lines = []
+            yield start, e
+            continue
+        if values is None:
+            continue
+        if columns is None:
+            columns = [column.strip() for column in values]
+        elif len(values) != len(columns):
+            yield start, ValueError(f"Expected {len(columns)} columns, got {len(values)}")
+        else:
+            yield start, {column: value for column, value in zip(columns, values) if value != ""}
+    if records.lines:
+        yield start, ValueError("A quoted field is not closed")
+
+
+def validate_row(model, row: dict) -> Tuple[Optional[dict], List[dict]]:
+    # IDs are always assigned by the database
+    row.pop("id", None)
+    try:
+        return model.model_validate(row).model_dump(exclude={"id"}), []
+    except ValidationError as e:
+        return None, [
+            {"field": ".".join(str(part) for part in error["loc"]), "message": error["msg"]}
+            for error in e.errors()
+        ]
+
@@ -0,0 +1,69 @@
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from typing import Any, Dict, Hashable, Optional
+from utils.cache import TTLCache
+import hashlib
+import os
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "10000"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "30"))
+# Clients and CDNs may keep the body but must revalidate it with If-None-Match
+CACHE_CONTROL = os.getenv("RESPONSE_CACHE_CONTROL", "no-cache")
+
+
+class CachedResponse:
+    __slots__ = ("body", "etag", "headers")
+
+    def __init__(self, body: bytes, headers: Optional[Dict[str, str]] = None):
+        self.body = body
+        self.etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        self.headers = headers or {}
+
+    def to_response(self, request: Request) -> Response:
+        headers = {**self.headers, "ETag": self.etag, "Cache-Control": CACHE_CONTROL}
+        if etag_matches(request.headers.get("if-none-match"), self.etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(content=self.body, media_type="application/json", headers=headers)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, so W/"x" matches "x"
+    candidates = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag in candidates
+
+
+def render(content: Any, headers: Optional[Dict[str, str]] = None) -> CachedResponse:
+    return CachedResponse(JSONResponse(jsonable_encoder(content)).body, headers)
+
+
+class ResponseCache:
+    """Serialized responses keyed by resource.
+
+    Every write bumps the generation: list keys embed it, so all cached pages go
+    stale at once, and a read that raced the write is not stored.
+    """
+
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL):
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.generation = 0
+
+    def lookup(self, key: Hashable) -> Optional[CachedResponse]:
+        return self.entries.get(key)
+
+    def store(self, key: Hashable, generation: int, response: CachedResponse) -> CachedResponse:
+        if generation == self.generation:
+            self.entries.set(key, response)
+        return response
+
+    def invalidate(self, *keys: Hashable) -> None:
+        self.generation += 1
+        for key in keys:
+            self.entries.pop(key)
+
+    def stats(self) -> dict:
+        return {**self.entries.stats(), "generation": self.generation}
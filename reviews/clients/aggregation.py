@@ -0,0 +1,59 @@
+from clients.http import upstreams
+from clients.resilience import DEADLINE_EXCEEDED, UpstreamUnavailable
+from typing import Any, Iterable, Optional
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Total budget per upstream call on the film page; the page is served without that part when it runs out
+FILM_PAGE_FILMS_TIMEOUT = float(os.getenv("FILM_PAGE_FILMS_TIMEOUT", "1"))
+FILM_PAGE_USERS_TIMEOUT = float(os.getenv("FILM_PAGE_USERS_TIMEOUT", "1"))
+USERS_BATCH_SIZE = int(os.getenv("USERS_BATCH_SIZE", "500"))
+
+
+class UpstreamResult:
+    __slots__ = ("value", "error", "missing")
+
+    def __init__(self, value: Any = None, error: Optional[str] = None, missing: bool = False):
+        self.value = value
+        self.error = error
+        self.missing = missing
+
+
+async def _call(upstream: str, timeout: float, method: str, url: str, **kwargs) -> UpstreamResult:
+    try:
+        r = await upstreams.request(upstream, method, url, deadline=timeout, **kwargs)
+    except UpstreamUnavailable as e:
+        logger.warning(str(e))
+        return UpstreamResult(error="timeout" if e.reason == DEADLINE_EXCEEDED else "unavailable")
+    except Exception as e:
+        logger.warning(f"{upstream} request failed: {type(e).__name__}: {str(e)}")
+        return UpstreamResult(error="unavailable")
+    if r.status_code == 404:
+        return UpstreamResult(missing=True)
+    if r.status_code != 200:
+        logger.warning(f"Unexpected {r.status_code} from {upstream}")
+        return UpstreamResult(error=f"status {r.status_code}")
+    return UpstreamResult(value=r.json())
+
+
+async def fetch_film(film_id: int) -> UpstreamResult:
+    return await _call("films", FILM_PAGE_FILMS_TIMEOUT, "GET", f"/films/{film_id}")
+
+
+async def fetch_authors(user_ids: Iterable[int]) -> UpstreamResult:
+    """Profiles keyed by user ID, fetched with as few /users/batch calls as possible."""
+    ids = sorted(set(user_ids))
+    if not ids:
+        return UpstreamResult(value={})
+
+    chunks = [ids[i:i + USERS_BATCH_SIZE] for i in range(0, len(ids), USERS_BATCH_SIZE)]
+    results = await asyncio.gather(*[
+        _call("users", FILM_PAGE_USERS_TIMEOUT, "POST", "/users/batch", idempotent=True, json={"ids": chunk})
+        for chunk in chunks
+    ])
+    authors = {user["id"]: user for result in results if result.value for user in result.value["users"]}
+    error = next((result.error for result in results if result.error), None)
+    return UpstreamResult(value=authors, error=error)
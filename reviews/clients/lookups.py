@@ -0,0 +1,55 @@
+from clients.http import upstreams
+from clients.resilience import UpstreamUnavailable
+from database.replica import LIVE, UNKNOWN, entity_replica
+from utils.cache import TTLCache
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+ID_CACHE_SIZE = int(os.getenv("ID_CACHE_SIZE", "50000"))
+FILM_CACHE_TTL = float(os.getenv("FILM_CACHE_TTL", "60"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+NEGATIVE_CACHE_TTL = float(os.getenv("NEGATIVE_CACHE_TTL", "5"))
+
+
+class ExistenceLookup:
+    """Answers "does this ID exist upstream?" with positive and short-lived negative caching.
+
+    IDs the local replica already knows about are answered without a request.
+    """
+
+    def __init__(self, upstream: str, kind: str, path: str, ttl: float, negative_ttl: float = NEGATIVE_CACHE_TTL,
+                 maxsize: int = ID_CACHE_SIZE):
+        self.upstream = upstream
+        self.kind = kind
+        self.path = path
+        self.negative_ttl = negative_ttl
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def exists(self, item_id: int) -> bool:
+        state = entity_replica.state(self.kind, item_id)
+        if state != UNKNOWN:
+            return state == LIVE
+
+        cached = self.cache.get(item_id)
+        if cached is not None:
+            return cached
+
+        r = await upstreams.request(self.upstream, "GET", self.path.format(item_id))
+        if r.status_code == 200:
+            self.cache.set(item_id, True)
+            return True
+        if r.status_code == 404:
+            self.cache.set(item_id, False, ttl=self.negative_ttl)
+            return False
+        if r.status_code >= 500:
+            # Not knowing is not the same as not found
+            raise UpstreamUnavailable(self.upstream, f"status {r.status_code}")
+
+        logger.warning(f"Unexpected {r.status_code} from {self.upstream} for ID {item_id}")
+        return False
+
+
+film_lookup = ExistenceLookup("films", "film", "/films/{}", ttl=FILM_CACHE_TTL)
+user_lookup = ExistenceLookup("users", "user", "/users/{}", ttl=USER_CACHE_TTL)
@@ -0,0 +1,46 @@
+from sqlalchemy import inspect, text
+from models.reviews import Review
+from models.events import KnownEntity
+from database.stats import refill_rating_stats
+
+
+def initial_schema(connection) -> None:
+    # checkfirst keeps this safe on databases created before migrations existed
+    Review.__table__.metadata.create_all(connection)
+
+
+def listing_indexes(connection) -> None:
+    for index in Review.__table__.indexes:
+        index.create(connection, checkfirst=True)
+    # The composite indexes lead with the same columns, so these only slowed down writes
+    connection.execute(text("DROP INDEX IF EXISTS ix_review_film_id"))
+    connection.execute(text("DROP INDEX IF EXISTS ix_review_user_id"))
+
+
+def known_entities(connection) -> None:
+    KnownEntity.__table__.create(connection, checkfirst=True)
+
+
+def known_entity_event_ids(connection) -> None:
+    # Tables created by migration 4 from the current model already have the column
+    columns = {column["name"] for column in inspect(connection).get_columns("known_entity")}
+    if "event_id" not in columns:
+        connection.execute(text("ALTER TABLE known_entity ADD COLUMN event_id INTEGER NOT NULL DEFAULT 0"))
+
+
+def more_listing_indexes(connection) -> None:
+    # Unfiltered listings and author listings sorted by rating had no index to page through
+    for index in Review.__table__.indexes:
+        index.create(connection, checkfirst=True)
+
+
+MIGRATIONS = [
+    (1, "Initial schema", initial_schema),
+    # Reviews written before the aggregates table existed are counted here
+    (2, "Backfill film rating aggregates", refill_rating_stats),
+    (3, "Composite indexes for review listings", listing_indexes),
+    (4, "Film and user IDs replicated from their services", known_entities),
+    # Existing rows start at 0, so the next event for any of them is newer
+    (5, "Order replicated IDs by outbox event", known_entity_event_ids),
+    (6, "Indexes for unfiltered and author review listings", more_listing_indexes),
+]
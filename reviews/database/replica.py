@@ -0,0 +1,260 @@
+from sqlalchemy import delete, exists, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from models.events import EntityEvent, EntityEventType, EntityKind, KnownEntity
+from models.reviews import FilmRatingStats, Review
+from database.db import engine, open_session
+from database.stats import apply_review_delta
+import asyncio
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+LIVE, DELETED, UNKNOWN = "live", "deleted", "unknown"
+
+# Other replicas of this service only learn about events through the table, so the
+# in-memory sets are rebuilt from it on this interval
+REPLICA_RELOAD_INTERVAL = float(os.getenv("REPLICA_RELOAD_INTERVAL", "60"))
+CLEANUP_INTERVAL = float(os.getenv("CLEANUP_INTERVAL", "5"))
+CLEANUP_BATCH_SIZE = int(os.getenv("CLEANUP_BATCH_SIZE", "1000"))
+CLEANUP_TOMBSTONES = 100
+# IDs below this live in a bitmap (at most REPLICA_BITMAP_MAX_ID / 8 bytes), any other ID in a set
+REPLICA_BITMAP_MAX_ID = int(os.getenv("REPLICA_BITMAP_MAX_ID", str(1 << 24)))
+
+REVIEW_COLUMNS = {EntityKind.film.value: Review.film_id, EntityKind.user.value: Review.user_id}
+
+
+class IdBitmap:
+    """A set of integer IDs at one bit each while they are small and dense, as serial IDs are.
+
+    Clients may choose IDs themselves, so IDs outside [0, max_id) go to a plain set instead.
+    """
+
+    __slots__ = ("_bits", "_sparse", "max_id", "count")
+
+    def __init__(self, max_id: int = REPLICA_BITMAP_MAX_ID):
+        self._bits = bytearray()
+        self._sparse = set()
+        self.max_id = max_id
+        self.count = 0
+
+    def add(self, item_id: int) -> None:
+        if item_id in self:
+            return
+        if 0 <= item_id < self.max_id:
+            index, bit = divmod(item_id, 8)
+            if index >= len(self._bits):
+                grown = max(index + 1, 2 * len(self._bits))
+                self._bits.extend(bytes(min(grown, (self.max_id + 7) // 8) - len(self._bits)))
+            self._bits[index] |= 1 << bit
+        else:
+            self._sparse.add(item_id)
+        self.count += 1
+
+    def discard(self, item_id: int) -> None:
+        if item_id not in self:
+            return
+        if 0 <= item_id < self.max_id:
+            index, bit = divmod(item_id, 8)
+            self._bits[index] &= ~(1 << bit)
+        else:
+            self._sparse.discard(item_id)
+        self.count -= 1
+
+    def __contains__(self, item_id: int) -> bool:
+        if 0 <= item_id < self.max_id:
+            index, bit = divmod(item_id, 8)
+            return index < len(self._bits) and bool(self._bits[index] & (1 << bit))
+        return item_id in self._sparse
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits) + sys.getsizeof(self._sparse)
+
+
+def _upsert():
+    return sqlite_insert if engine.dialect.name == "sqlite" else pg_insert
+
+
+class EntityReplica:
+    """Film and user IDs fed by the films and users outboxes, answering "does this ID exist?" locally.
+
+    An ID is live, deleted, or unknown (not replicated yet), in which case callers fall back
+    to asking the owning service. Deletes also queue a cleanup of the reviews that referenced it.
+    """
+
+    def __init__(self):
+        self.live: Dict[str, IdBitmap] = {kind.value: IdBitmap() for kind in EntityKind}
+        self.deleted: Dict[str, IdBitmap] = {kind.value: IdBitmap() for kind in EntityKind}
+        self.events = 0
+        self.cleaned = 0
+        self.loaded_at: Optional[float] = None
+        self.stale = False
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def state(self, kind: str, entity_id: int) -> str:
+        if entity_id in self.deleted[kind]:
+            return DELETED
+        if entity_id in self.live[kind]:
+            return LIVE
+        return UNKNOWN
+
+    async def load(self) -> None:
+        live = {kind.value: IdBitmap() for kind in EntityKind}
+        deleted = {kind.value: IdBitmap() for kind in EntityKind}
+        applied = self.events
+        async with open_session() as session:
+            rows = await session.execute(select(KnownEntity.kind, KnownEntity.entity_id, KnownEntity.deleted))
+            for kind, entity_id, is_deleted in rows:
+                (deleted if is_deleted else live)[kind].add(entity_id)
+        self.live, self.deleted = live, deleted
+        self.loaded_at = time.monotonic()
+        # Events applied while the table was being read may be missing from the snapshot
+        self.stale = self.events != applied
+
+    async def apply(self, session, events: List[EntityEvent]) -> None:
+        """Stores a batch of events; redelivered and reordered events are harmless.
+
+        The newest event per ID wins, by outbox ID, so a create after a delete revives an ID
+        that was reused, while a late copy of an older event changes nothing.
+        """
+        latest: Dict[tuple, EntityEvent] = {}
+        for event in sorted(events, key=lambda e: e.id):
+            latest[(event.kind.value, event.entity_id)] = event
+        if not latest:
+            return
+
+        table = KnownEntity.__table__
+        statement = _upsert()(table).values([
+            {"kind": kind, "entity_id": entity_id, "deleted": event.type == EntityEventType.deleted,
+             "event_id": event.id, "cleaned_at": None}
+            for (kind, entity_id), event in latest.items()
+        ])
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.kind, table.c.entity_id],
+            # A delete that replaces a live row (or a revived one) needs a fresh cleanup pass
+            set_={"deleted": statement.excluded.deleted, "event_id": statement.excluded.event_id,
+                  "cleaned_at": None},
+            where=statement.excluded.event_id > table.c.event_id,
+        ).returning(table.c.kind, table.c.entity_id, table.c.deleted)
+        # Only rows that were inserted or actually changed come back
+        changed = (await session.execute(statement)).all()
+        await session.commit()
+
+        self.events += len(events)
+        try:
+            for kind, entity_id, is_deleted in changed:
+                if is_deleted:
+                    self.live[kind].discard(entity_id)
+                    self.deleted[kind].add(entity_id)
+                else:
+                    self.deleted[kind].discard(entity_id)
+                    self.live[kind].add(entity_id)
+        except Exception as e:
+            # The table is already committed and redelivery would not help, so the sets are
+            # rebuilt from it by the maintenance loop instead of failing the batch
+            logger.error(f"Couldn't apply events to the in-memory replica, reloading it: {type(e).__name__}: {str(e)}")
+            self.stale = True
+        if self.stale or any(is_deleted for _, _, is_deleted in changed):
+            self._wakeup.set()
+
+    async def start(self) -> None:
+        await self.load()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                if self.stale or time.monotonic() - self.loaded_at >= REPLICA_RELOAD_INTERVAL:
+                    await self.load()
+                await self.clean_orphans()
+            except Exception as e:
+                logger.warning(f"Replica maintenance failed: {type(e).__name__}: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), CLEANUP_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def clean_orphans(self) -> int:
+        # A replica that has not seen a delete yet may still accept reviews for it until its
+        # next reload, so tombstones are swept again for two reload intervals after the first pass
+        cutoff = datetime.utcnow() - timedelta(seconds=2 * REPLICA_RELOAD_INTERVAL)
+        async with open_session() as session:
+            tombstones = (await session.execute(
+                select(KnownEntity.kind, KnownEntity.entity_id)
+                .where(KnownEntity.deleted, or_(KnownEntity.cleaned_at.is_(None), KnownEntity.cleaned_at > cutoff))
+                .order_by(KnownEntity.cleaned_at.nulls_first())
+                .limit(CLEANUP_TOMBSTONES)
+            )).all()
+
+        removed = 0
+        for kind, entity_id in tombstones:
+            removed += await purge_reviews(kind, entity_id)
+            async with open_session() as session:
+                await session.execute(
+                    update(KnownEntity)
+                    .where(KnownEntity.kind == kind, KnownEntity.entity_id == entity_id, KnownEntity.deleted)
+                    .values(cleaned_at=func.coalesce(KnownEntity.cleaned_at, datetime.utcnow()))
+                )
+                await session.commit()
+        if removed:
+            logger.info(f"Removed {removed} reviews of deleted films and users")
+        self.cleaned += removed
+        return removed
+
+    def stats(self) -> dict:
+        stats = {
+            kind: {
+                "live": len(self.live[kind]),
+                "deleted": len(self.deleted[kind]),
+                "bytes": self.live[kind].nbytes + self.deleted[kind].nbytes,
+            }
+            for kind in self.live
+        }
+        return {**stats, "events": self.events, "reviews_cleaned": self.cleaned}
+
+
+async def purge_reviews(kind: str, entity_id: int) -> int:
+    """Deletes the reviews of a deleted film or user in batches, keeping the rating aggregates in step.
+
+    Stops as soon as the tombstone is gone, i.e. the ID was created again and its reviews are new.
+    """
+    column = REVIEW_COLUMNS[kind]
+    tombstone = exists().where(KnownEntity.kind == kind, KnownEntity.entity_id == entity_id, KnownEntity.deleted)
+    removed = 0
+    while True:
+        async with open_session() as session:
+            batch = select(Review.id).where(column == entity_id).limit(CLEANUP_BATCH_SIZE)
+            rows = (await session.execute(
+                delete(Review).where(Review.id.in_(batch), tombstone).returning(Review.film_id, Review.rating)
+            )).all()
+            for (film_id, rating), count in Counter(rows).items():
+                await apply_review_delta(session, film_id, rating, -count)
+            if kind == EntityKind.film.value:
+                await session.execute(
+                    delete(FilmRatingStats).where(FilmRatingStats.film_id == entity_id, tombstone)
+                )
+            await session.commit()
+        removed += len(rows)
+        if len(rows) < CLEANUP_BATCH_SIZE:
+            return removed
+
+
+entity_replica = EntityReplica()
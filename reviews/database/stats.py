@@ -0,0 +1,78 @@
+from sqlalchemy import case, delete, func, insert, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models.reviews import FilmRatingStats, FilmRatingSummary, Review
+from database.db import engine
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+RATINGS = range(1, 11)
+stats_table = FilmRatingStats.__table__
+
+
+async def apply_review_delta(session, film_id: int, rating: int, delta: int) -> None:
+    # Runs inside the caller's transaction, so the aggregate commits or rolls back with the review
+    changes = {"review_count": delta, "rating_sum": delta * rating, f"rating_{rating}": delta}
+    if delta < 0:
+        statement = (
+            update(stats_table)
+            .where(stats_table.c.film_id == film_id)
+            .values({column: stats_table.c[column] + value for column, value in changes.items()})
+        )
+    else:
+        upsert = sqlite_insert if engine.dialect.name == "sqlite" else pg_insert
+        statement = upsert(stats_table).values(film_id=film_id, **changes)
+        statement = statement.on_conflict_do_update(
+            index_elements=[stats_table.c.film_id],
+            set_={column: stats_table.c[column] + statement.excluded[column] for column in changes},
+        )
+    await session.execute(statement)
+
+
+def summarize(film_id: int, stats) -> FilmRatingSummary:
+    if stats is None or stats.review_count <= 0:
+        return FilmRatingSummary(
+            film_id=film_id,
+            review_count=0,
+            average_rating=None,
+            histogram={rating: 0 for rating in RATINGS},
+        )
+    return FilmRatingSummary(
+        film_id=film_id,
+        review_count=stats.review_count,
+        average_rating=round(stats.rating_sum / stats.review_count, 2),
+        histogram={rating: getattr(stats, f"rating_{rating}") for rating in RATINGS},
+    )
+
+
+def refill_rating_stats(connection) -> int:
+    columns = ["film_id", "review_count", "rating_sum"] + [f"rating_{rating}" for rating in RATINGS]
+    aggregates = select(
+        Review.film_id,
+        func.count(),
+        func.sum(Review.rating),
+        *[func.sum(case((Review.rating == rating, 1), else_=0)) for rating in RATINGS],
+    ).group_by(Review.film_id)
+
+    if connection.dialect.name == "postgresql":
+        # Block review writes until the new aggregates are committed
+        connection.execute(text(f"LOCK TABLE {Review.__tablename__} IN SHARE MODE"))
+    connection.execute(delete(stats_table))
+    connection.execute(insert(stats_table).from_select(columns, aggregates))
+    films = connection.execute(select(func.count()).select_from(stats_table)).scalar_one()
+    logger.info(f"Rebuilt rating aggregates for {films} films")
+    return films
+
+
+def rebuild_rating_stats() -> int:
+    with engine.begin() as connection:
+        return refill_rating_stats(connection)
+
+
+if __name__ == "__main__":
+    # python -m database.stats rebuild
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python -m database.stats rebuild")
+    rebuild_rating_stats()
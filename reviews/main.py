@@ -1,15 +1,41 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Header
-from sqlmodel import select, Session
-from typing import List, Optional
+from fastapi import FastAPI, Depends, HTTPException, status, Header, Query, Response
+from sqlmodel import select
+from sqlalchemy import delete, tuple_, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import List, Optional, Tuple
+from datetime import datetime
 
-from starlette.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse, StreamingResponse
 
-from models.reviews import Review
-from database.db import get_session, wait_for_db
-import httpx
+from models.events import EntityEventBatch
+from models.reviews import (FilmPage, FilmRatingStats, FilmRatingSummary, Review, ReviewModerationRequest,
+                            ReviewModerationResponse, ReviewSort)
+from database.db import apply_migrations, async_engine, engine, get_session, ping_db, stream_scalars, wait_for_db
+from database.migrations import MIGRATIONS
+from database.pool import pool_stats
+from observability.health import Startup, setup_health
+from observability.log import setup_logging
+from observability.metrics import setup_metrics
+from observability.profiling import setup_profiling
+from middleware.admission import setup_admission
+from database.replica import entity_replica
+from database.stats import apply_review_delta, summarize
+from security.tokens import verify_token
+from security.events import EVENTS_SECRET_HEADER, verify_events_secret
+from clients.http import upstreams
+from clients.aggregation import fetch_authors, fetch_film
+from clients.lookups import film_lookup, user_lookup
+from clients.resilience import UpstreamUnavailable
+from utils.pagination import (DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, decode_cursor, paginate,
+                              set_next_cursor)
+from utils.fast_json import FAST_LIST_RESPONSES, model_columns, rows_response
+import asyncio
+import json
 import logging
+import os
 
-logging.basicConfig(level=logging.INFO)
+setup_logging(engine, async_engine)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(
@@ -17,86 +43,284 @@ app = FastAPI(
     description="API for film reviews",
     version="1.0.0"
 )
+setup_metrics(app, engine, async_engine)
+setup_profiling(app, engine, async_engine)
+setup_admission(app)
+
+startup = Startup(
+    ("database", wait_for_db),
+    ("migrations", lambda: apply_migrations(MIGRATIONS)),
+    ("replica", entity_replica.start),
+)
+setup_health(app, startup, ping_db)
+
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "500"))
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
 
 
 @app.on_event("startup")
-def startup():
-    wait_for_db()
-    logger.info("Review service started")
+async def startup_event():
+    logger.info("Launching the review service...")
+    startup.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await startup.cancel()
+    await entity_replica.stop()
+    await upstreams.aclose()
+
+
+@app.get("/internal/db-pool", include_in_schema=False)
+async def db_pool_stats():
+    return {"sync": pool_stats(engine), "async": pool_stats(async_engine)}
+
+
+@app.get("/internal/http-pool", include_in_schema=False)
+async def http_pool_stats():
+    return upstreams.stats()
+
+
+@app.get("/internal/lookup-cache", include_in_schema=False)
+async def lookup_cache_stats():
+    return {"films": film_lookup.cache.stats(), "users": user_lookup.cache.stats()}
+
+
+@app.get("/internal/replica", include_in_schema=False)
+async def replica_stats():
+    return entity_replica.stats()
+
+
+@app.post("/internal/events", include_in_schema=False)
+async def receive_events(
+        batch: EntityEventBatch,
+        secret: Optional[str] = Header(None, alias=EVENTS_SECRET_HEADER),
+        session: AsyncSession = Depends(get_session)
+):
+    # Published by the films and users outbox relays, at least once
+    verify_events_secret(secret)
+    await entity_replica.apply(session, batch.events)
+    return {"applied": len(batch.events)}
 
 
 @app.post("/reviews", status_code=status.HTTP_201_CREATED)
 async def create_review(
         review: Review,
         token: str = Header(..., alias="Authorization"),
-        session: Session = Depends(get_session)
+        session: AsyncSession = Depends(get_session)
 ):
-    token = token.replace("Bearer ", "").strip()
-    async with httpx.AsyncClient() as client:
-        auth_resp = await client.post(
-            "http://auth:8001/verify",
-            headers={"Authorization": f"Bearer {token}"}
-        )
-        if auth_resp.status_code != 200:
-            raise HTTPException(status_code=401, detail="Invalid token")
-
-        film_resp = await client.get(f"http://films:8000/films/{review.film_id}")
-        if film_resp.status_code != 200:
-            raise HTTPException(status_code=404, detail="Film not found")
+    await verify_token(token)
 
-        user_resp = await client.get(f"http://users:8003/users/{review.user_id}")
-        if user_resp.status_code != 200:
-            raise HTTPException(status_code=404, detail="User not found")
+    try:
+        film_exists, user_exists = await asyncio.gather(
+            film_lookup.exists(review.film_id),
+            user_lookup.exists(review.user_id),
+        )
+    except UpstreamUnavailable as e:
+        logger.warning(f"Couldn't check the review references: {e}")
+        raise HTTPException(status_code=503, detail=f"The {e.upstream} service is unavailable")
+    if not film_exists:
+        raise HTTPException(status_code=404, detail="Film not found")
+    if not user_exists:
+        raise HTTPException(status_code=404, detail="User not found")
 
     try:
         session.add(review)
-        session.commit()
-        session.refresh(review)
+        await apply_review_delta(session, review.film_id, review.rating, 1)
+        await session.commit()
+        await session.refresh(review)
         return review
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         logger.error(f"Error creating review: {e}")
         raise HTTPException(400, detail="Invalid review data")
 
 
+# Cursor columns per ordering; with or without a film_id or user_id filter, each one is served
+# by a composite index (see Review.__table_args__)
+SORT_KEYS = {
+    ReviewSort.oldest: ((Review.created_at, Review.id), (datetime.fromisoformat, int)),
+    ReviewSort.newest: ((Review.created_at, Review.id), (datetime.fromisoformat, int)),
+    ReviewSort.top_rated: ((Review.rating, Review.created_at, Review.id), (int, datetime.fromisoformat, int)),
+}
+
+
+async def _review_page(session: AsyncSession, sort: ReviewSort, limit: int, cursor: Optional[str],
+                       unbounded: bool = False, film_id: Optional[int] = None, user_id: Optional[int] = None,
+                       is_approved: Optional[bool] = None, min_rating: Optional[int] = None,
+                       max_rating: Optional[int] = None, as_rows: bool = False) -> Tuple[list, Optional[str]]:
+    # as_rows fetches plain column tuples in Review field order instead of Review objects
+    columns, cursor_types = SORT_KEYS[sort]
+    descending = sort != ReviewSort.oldest
+    query = select(*model_columns(Review)) if as_rows else select(Review)
+    query = query.order_by(*(column.desc() if descending else column for column in columns))
+    if film_id is not None:
+        query = query.where(Review.film_id == film_id)
+    if user_id is not None:
+        query = query.where(Review.user_id == user_id)
+    if is_approved is not None:
+        query = query.where(Review.is_approved == is_approved)
+    if min_rating is not None:
+        query = query.where(Review.rating >= min_rating)
+    if max_rating is not None:
+        query = query.where(Review.rating <= max_rating)
+    if unbounded:
+        return (await session.exec(query)).all(), None
+
+    if cursor:
+        last = decode_cursor(cursor, cursor_types)
+        query = query.where(tuple_(*columns) < tuple(last) if descending else tuple_(*columns) > tuple(last))
+    rows = (await session.exec(query.limit(limit + 1))).all()
+    return paginate(rows, limit, key=lambda r: tuple(getattr(r, column.key) for column in columns))
+
+
 @app.get("/reviews", response_model=List[Review])
-def get_reviews(
+async def get_reviews(
+        response: Response,
         film_id: Optional[int] = None,
-        session: Session = Depends(get_session)
+        user_id: Optional[int] = None,
+        is_approved: Optional[bool] = None,
+        min_rating: Optional[int] = Query(None, ge=1, le=10),
+        max_rating: Optional[int] = Query(None, ge=1, le=10),
+        sort: ReviewSort = ReviewSort.oldest,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        unbounded: bool = Query(False, description="Return every matching review in one response"),
+        session: AsyncSession = Depends(get_session)
 ):
-    query = select(Review)
-    if film_id:
-        query = query.where(Review.film_id == film_id)
-    return session.exec(query).all()
+    reviews, next_cursor = await _review_page(
+        session, sort, limit, cursor, unbounded, film_id=film_id, user_id=user_id,
+        is_approved=is_approved, min_rating=min_rating, max_rating=max_rating, as_rows=FAST_LIST_RESPONSES,
+    )
+    if FAST_LIST_RESPONSES:
+        return rows_response(Review, reviews, {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None)
+    set_next_cursor(response, next_cursor)
+    return reviews
+
+
+@app.post("/reviews/moderation",
+          response_model=ReviewModerationResponse,
+          summary="Approve or reject several reviews at once",
+          responses={
+              400: {"description": "Too many IDs requested"}
+          })
+async def moderate_reviews(
+        moderation: ReviewModerationRequest,
+        token: str = Header(..., alias="Authorization"),
+        session: AsyncSession = Depends(get_session)
+):
+    await verify_token(token)
+
+    ids = list(dict.fromkeys(moderation.ids))
+    if len(ids) > BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {BATCH_MAX_SIZE} IDs can be moderated at once"
+        )
+
+    updated = set()
+    if ids:
+        statement = (
+            update(Review)
+            .where(Review.id.in_(ids))
+            .values(is_approved=moderation.approved)
+            .returning(Review.id)
+        )
+        updated = set((await session.execute(statement)).scalars().all())
+        await session.commit()
+    logger.info(f"Moderated {len(updated)} reviews, approved={moderation.approved}")
+    return ReviewModerationResponse(
+        updated=[review_id for review_id in ids if review_id in updated],
+        missing=[review_id for review_id in ids if review_id not in updated]
+    )
+
+
+@app.get("/reviews/export",
+         response_class=StreamingResponse,
+         responses={200: {"content": {"application/x-ndjson": {}}}})
+async def export_reviews(since_id: int = Query(0, ge=0, description="Resume after this review ID")):
+    async def ndjson():
+        query = select(Review).where(Review.id > since_id).order_by(Review.id)
+        async for chunk in stream_scalars(query, EXPORT_CHUNK_SIZE):
+            yield "".join(json.dumps(jsonable_encoder(review)) + "\n" for review in chunk)
+
+    logger.info(f"Review export requested from ID {since_id}")
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
 
 
 @app.get("/reviews/{review_id}", response_model=Review)
-def get_review(review_id: int, session: Session = Depends(get_session)):
-    review = session.get(Review, review_id)
+async def get_review(review_id: int, session: AsyncSession = Depends(get_session)):
+    review = await session.get(Review, review_id)
     if not review:
         raise HTTPException(404, detail="Review not found")
     return review
 
 
+@app.get("/films/{film_id}/stats", response_model=FilmRatingSummary)
+async def get_film_stats(film_id: int, session: AsyncSession = Depends(get_session)):
+    stats = await session.get(FilmRatingStats, film_id)
+    return summarize(film_id, stats)
+
+
+@app.get("/films/{film_id}/page",
+         response_model=FilmPage,
+         summary="Film, a page of its reviews, their authors and rating stats in one response",
+         responses={
+             404: {"description": "The movie was not found"}
+         })
+async def get_film_page(
+        film_id: int,
+        response: Response,
+        sort: ReviewSort = ReviewSort.newest,
+        is_approved: Optional[bool] = None,
+        limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        session: AsyncSession = Depends(get_session)
+):
+    # The film is fetched while the reviews are read; authors follow as soon as the reviews are known.
+    # The session is not shared between tasks, so every local query stays in local_part
+    async def local_part():
+        reviews, next_cursor = await _review_page(session, sort, limit, cursor, film_id=film_id,
+                                                  is_approved=is_approved)
+        stats = await session.get(FilmRatingStats, film_id)
+        authors = await fetch_authors({review.user_id for review in reviews})
+        return reviews, next_cursor, stats, authors
+
+    film, (reviews, next_cursor, stats, authors) = await asyncio.gather(fetch_film(film_id), local_part())
+    if film.missing:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="The movie was not found")
+
+    errors = {name: result.error for name, result in (("films", film), ("users", authors)) if result.error}
+    set_next_cursor(response, next_cursor)
+    return FilmPage(
+        film=film.value,
+        reviews=reviews,
+        authors=authors.value or {},
+        stats=summarize(film_id, stats),
+        partial=bool(errors),
+        errors=errors,
+    )
+
+
 @app.delete("/reviews/{review_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_review(
         review_id: int,
         token: str = Header(..., alias="Authorization"),
-        session: Session = Depends(get_session)
+        session: AsyncSession = Depends(get_session)
 ):
-    async with httpx.AsyncClient() as client:
-        r = await client.post(
-            "http://auth:8001/verify",
-            headers={"Authorization": f"Bearer {token}"}
-        )
-    if r.status_code != 200:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    await verify_token(token)
 
-    review = session.get(Review, review_id)
-    if not review:
+    # The row returned is the one this statement removed, so a concurrent delete or an orphan
+    # cleanup that got there first cannot make the aggregates count the review twice
+    deleted = (await session.execute(
+        delete(Review).where(Review.id == review_id).returning(Review.film_id, Review.rating)
+    )).first()
+    if deleted is None:
+        await session.rollback()
         raise HTTPException(404, detail="Review not found")
-    session.delete(review)
-    session.commit()
+    film_id, rating = deleted
+    await apply_review_delta(session, film_id, rating, -1)
+    await session.commit()
 
     return JSONResponse(
         content={"detail": "The review was deleted successfully"},
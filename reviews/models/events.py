@@ -0,0 +1,44 @@
+from sqlmodel import SQLModel, Field
+from sqlalchemy import Index, text
+from datetime import datetime
+from enum import Enum
+from typing import List, Optional
+
+
+class EntityKind(str, Enum):
+    film = "film"
+    user = "user"
+
+
+class EntityEventType(str, Enum):
+    created = "created"
+    deleted = "deleted"
+
+
+class KnownEntity(SQLModel, table=True):
+    """Film and user IDs replicated from the films and users outboxes; deletes leave a tombstone."""
+
+    __tablename__ = "known_entity"
+    # Tombstones still waiting for (or recently given) a cascade cleanup pass
+    __table_args__ = (
+        Index("ix_known_entity_tombstones", "cleaned_at", postgresql_where=text("deleted")),
+    )
+
+    kind: str = Field(primary_key=True)
+    entity_id: int = Field(primary_key=True)
+    deleted: bool = Field(default=False)
+    cleaned_at: Optional[datetime] = None
+    # Outbox ID of the last event applied; only a newer event may change the row, since IDs
+    # can be reused (clients choose them) and events arrive redelivered or out of order
+    event_id: int = Field(default=0)
+
+
+class EntityEvent(SQLModel):
+    id: int
+    kind: EntityKind
+    type: EntityEventType
+    entity_id: int = Field(gt=0)
+
+
+class EntityEventBatch(SQLModel):
+    events: List[EntityEvent]
@@ -1,13 +1,76 @@
 from sqlmodel import SQLModel, Field
-from typing import Optional
+from sqlalchemy import Index
+from typing import Any, Dict, List, Optional
 from datetime import datetime
+from enum import Enum
 
 
 class Review(SQLModel, table=True):
+    # Listings filter by film, by author or by neither and read in (created_at, id) or
+    # (rating, created_at, id) order; every combination has an index that yields rows in that
+    # order, and a backward scan of the same index serves the descending sorts
+    __table_args__ = (
+        Index("ix_review_film_created", "film_id", "created_at", "id"),
+        Index("ix_review_user_created", "user_id", "created_at", "id"),
+        Index("ix_review_film_rating", "film_id", "rating", "created_at", "id"),
+        Index("ix_review_user_rating", "user_id", "rating", "created_at", "id"),
+        Index("ix_review_created", "created_at", "id"),
+        Index("ix_review_rating", "rating", "created_at", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    film_id: int = Field(index=True)
-    user_id: int = Field(index=True)
+    film_id: int
+    user_id: int
     text: str = Field(min_length=10, max_length=2000)
     rating: int = Field(ge=1, le=10)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     is_approved: bool = Field(default=False)
+
+
+class FilmRatingStats(SQLModel, table=True):
+    film_id: int = Field(primary_key=True)
+    review_count: int = Field(default=0)
+    rating_sum: int = Field(default=0)
+    rating_1: int = Field(default=0)
+    rating_2: int = Field(default=0)
+    rating_3: int = Field(default=0)
+    rating_4: int = Field(default=0)
+    rating_5: int = Field(default=0)
+    rating_6: int = Field(default=0)
+    rating_7: int = Field(default=0)
+    rating_8: int = Field(default=0)
+    rating_9: int = Field(default=0)
+    rating_10: int = Field(default=0)
+
+
+class FilmRatingSummary(SQLModel):
+    film_id: int
+    review_count: int
+    average_rating: Optional[float]
+    histogram: Dict[int, int]
+
+
+class ReviewSort(str, Enum):
+    oldest = "oldest"
+    newest = "newest"
+    top_rated = "top_rated"
+
+
+class ReviewModerationRequest(SQLModel):
+    ids: List[int]
+    approved: bool
+
+
+class ReviewModerationResponse(SQLModel):
+    updated: List[int]
+    missing: List[int]
+
+
+class FilmPage(SQLModel):
+    film: Optional[Dict[str, Any]]
+    reviews: List[Review]
+    authors: Dict[int, Dict[str, Any]]
+    stats: FilmRatingSummary
+    # True when an upstream timed out or failed and its part of the page is missing
+    partial: bool
+    errors: Dict[str, str]
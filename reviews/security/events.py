@@ -0,0 +1,14 @@
+from fastapi import HTTPException, status
+from typing import Optional
+import hmac
+import os
+
+# Shared with the films and users outbox relays; while unset, every event is refused
+EVENTS_SECRET = os.getenv("EVENTS_SECRET", "")
+EVENTS_SECRET_HEADER = "X-Events-Secret"
+
+
+def verify_events_secret(secret: Optional[str]) -> None:
+    # A delete event removes every review of the film or user, so only the relays may send them
+    if not EVENTS_SECRET or secret is None or not hmac.compare_digest(secret.encode(), EVENTS_SECRET.encode()):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid events secret")
@@ -0,0 +1,94 @@
+from fastapi import HTTPException
+from jose import JWTError, jwt
+from typing import Optional
+from clients.http import upstreams
+from clients.resilience import UpstreamUnavailable
+from utils.cache import TTLCache
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Must match authorization/main.py
+SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
+ALGORITHM = "HS256"
+
+# "local" checks signature and exp in-process, "remote" asks the auth service
+AUTH_VERIFY_MODE = os.getenv("AUTH_VERIFY_MODE", "local")
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))
+
+
+class TokenVerifier:
+    def __init__(
+            self,
+            mode: str = AUTH_VERIFY_MODE,
+            secret_key: str = SECRET_KEY,
+            algorithm: str = ALGORITHM,
+            cache_size: int = TOKEN_CACHE_SIZE,
+            cache_ttl: float = TOKEN_CACHE_TTL,
+    ):
+        if mode not in ("local", "remote"):
+            raise ValueError(f"Unknown AUTH_VERIFY_MODE: {mode}")
+        self.mode = mode
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+
+    async def verify(self, token: str) -> str:
+        token = token.replace("Bearer ", "").strip()
+        email = self.cache.get(token)
+        if email is not None:
+            return email
+
+        if self.mode == "local":
+            claims = self._decode(token)
+        else:
+            claims = await self._verify_remote(token)
+
+        email = claims.get("sub")
+        if email is None:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        self.cache.set(token, email, ttl=self._remaining_lifetime(claims))
+        return email
+
+    def _decode(self, token: str) -> dict:
+        try:
+            return jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+        except JWTError:
+            raise HTTPException(status_code=401, detail="Invalid token")
+
+    async def _verify_remote(self, token: str) -> dict:
+        try:
+            # Verification reads only, so it may be retried like a GET
+            r = await upstreams.request(
+                "auth", "POST", "/verify",
+                idempotent=True,
+                headers={"Authorization": f"Bearer {token}"}
+            )
+        except UpstreamUnavailable as e:
+            logger.warning(f"Token verification failed: {e}")
+            raise HTTPException(status_code=503, detail="Authorization service unavailable")
+        if r.status_code >= 500:
+            raise HTTPException(status_code=503, detail="Authorization service unavailable")
+        if r.status_code != 200:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        # The signature was checked by auth, only the expiry is needed for caching
+        claims = jwt.get_unverified_claims(token)
+        claims["sub"] = r.json().get("email")
+        return claims
+
+    @staticmethod
+    def _remaining_lifetime(claims: dict) -> Optional[float]:
+        exp = claims.get("exp")
+        if exp is None:
+            return None
+        return float(exp) - time.time()
+
+
+token_verifier = TokenVerifier()
+
+
+async def verify_token(token: str) -> str:
+    return await token_verifier.verify(token)
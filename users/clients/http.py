@@ -0,0 +1,125 @@
+from typing import Dict, Optional, Tuple
+from clients.resilience import CircuitBreaker, RetryBudget, resilient_request
+from observability.metrics import instrument_client
+from observability.profiling import trace_client
+import httpx
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_URLS = {
+    "auth": os.getenv("AUTH_URL", "http://auth:8001"),
+    "films": os.getenv("FILMS_URL", "http://films:8000"),
+    "reviews": os.getenv("REVIEWS_URL", "http://reviews:8002"),
+    "users": os.getenv("USERS_URL", "http://users:8003"),
+}
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "5"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "2"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+
+def upstream_timeout(name: str) -> httpx.Timeout:
+    # AUTH_TIMEOUT, FILMS_TIMEOUT, USERS_TIMEOUT override HTTP_TIMEOUT per upstream
+    total = float(os.getenv(f"{name.upper()}_TIMEOUT", HTTP_TIMEOUT))
+    return httpx.Timeout(total, connect=min(HTTP_CONNECT_TIMEOUT, total))
+
+
+def upstream_deadline(name: str) -> float:
+    # AUTH_DEADLINE, FILMS_DEADLINE, USERS_DEADLINE bound a whole call including retries;
+    # by default retries must fit in the time a single attempt is allowed
+    timeout = os.getenv(f"{name.upper()}_TIMEOUT", HTTP_TIMEOUT)
+    return float(os.getenv(f"{name.upper()}_DEADLINE", timeout))
+
+
+class UpstreamClients:
+    """One keep-alive AsyncClient per upstream, shared for the service lifetime.
+
+    Calls should go through request(), which adds the deadline, retries and circuit breaker.
+    """
+
+    def __init__(
+            self,
+            urls: Dict[str, str] = UPSTREAM_URLS,
+            max_connections: int = HTTP_MAX_CONNECTIONS,
+            max_keepalive: int = HTTP_MAX_KEEPALIVE,
+            keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY,
+    ):
+        self.urls = dict(urls)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        # Breakers and budgets outlive the clients, so mounting a client keeps the upstream's health
+        self._policies: Dict[str, Tuple[CircuitBreaker, RetryBudget]] = {}
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            if name not in self.urls:
+                raise KeyError(f"Unknown upstream: {name}")
+            client = httpx.AsyncClient(
+                base_url=self.urls[name],
+                timeout=upstream_timeout(name),
+                limits=self.limits,
+            )
+            instrument_client(client, name)
+            trace_client(client, name)
+            self._clients[name] = client
+            logger.info(f"Opened HTTP pool for upstream {name} ({self.urls[name]})")
+        return client
+
+    def policy(self, name: str) -> Tuple[CircuitBreaker, RetryBudget]:
+        policy = self._policies.get(name)
+        if policy is None:
+            policy = self._policies[name] = (CircuitBreaker(name), RetryBudget())
+        return policy
+
+    async def request(self, name: str, method: str, url: str, idempotent: Optional[bool] = None,
+                      deadline: Optional[float] = None, **kwargs) -> httpx.Response:
+        # idempotent defaults to the method's semantics; read-only POSTs such as /users/batch pass True.
+        # A caller with a tighter budget passes it as deadline, so slow answers still count against the breaker
+        breaker, budget = self.policy(name)
+        deadline = upstream_deadline(name) if deadline is None else deadline
+        return await resilient_request(self.get(name), name, breaker, budget, deadline, method, url, idempotent,
+                                       **kwargs)
+
+    def mount(self, name: str, client: httpx.AsyncClient) -> None:
+        # Replaces the pooled client, e.g. with one using an ASGI transport
+        instrument_client(client, name)
+        trace_client(client, name)
+        self._clients[name] = client
+
+    async def aclose(self) -> None:
+        for name, client in list(self._clients.items()):
+            await client.aclose()
+            logger.info(f"Closed HTTP pool for upstream {name}")
+        self._clients.clear()
+
+    def stats(self) -> Dict[str, dict]:
+        return {
+            name: {**_pool_stats(client), "breaker": self.policy(name)[0].stats()}
+            for name, client in self._clients.items()
+        }
+
+
+def _pool_stats(client: httpx.AsyncClient) -> dict:
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = getattr(pool, "connections", [])
+    open_conns = [c for c in connections if not c.is_closed()]
+    idle = sum(1 for c in open_conns if c.is_idle())
+    return {
+        "open": len(open_conns),
+        "idle": idle,
+        "in_flight": len(open_conns) - idle,
+        "closed": client.is_closed,
+    }
+
+
+upstreams = UpstreamClients()
+
@@ -0,0 +1,177 @@
+from observability.metrics import UPSTREAM_BREAKER_STATE, UPSTREAM_BREAKER_TRANSITIONS, UPSTREAM_REJECTED, UPSTREAM_RETRIES
+from typing import Optional
+import asyncio
+import httpx
+import logging
+import os
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_MAX_ATTEMPTS = int(os.getenv("UPSTREAM_MAX_ATTEMPTS", "3"))
+UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.05"))
+UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "1"))
+# Each call earns this fraction of a retry; bursts may spend up to RETRY_BUDGET_MAX saved retries
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_MAX = float(os.getenv("RETRY_BUDGET_MAX", "10"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "10"))
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRYABLE_STATUSES = frozenset({502, 503, 504})
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+DEADLINE_EXCEEDED = "deadline exceeded"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class UpstreamUnavailable(Exception):
+    """The upstream could not be reached, or its breaker is open."""
+
+    def __init__(self, upstream: str, reason: str):
+        super().__init__(f"{upstream} unavailable: {reason}")
+        self.upstream = upstream
+        self.reason = reason
+
+
+class RetryBudget:
+    """Caps retries to a fraction of calls, so retries cannot multiply the load on a struggling upstream."""
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, maximum: float = RETRY_BUDGET_MAX):
+        self.ratio = ratio
+        self.maximum = maximum
+        self.balance = maximum
+
+    def deposit(self) -> None:
+        self.balance = min(self.maximum, self.balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.balance < 1:
+            return False
+        self.balance -= 1
+        return True
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets a single probe through once the reset timeout passed."""
+
+    def __init__(self, upstream: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.upstream = upstream
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        UPSTREAM_BREAKER_STATE.labels(upstream).set(0)
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self._transition(HALF_OPEN)
+        if self.probing:
+            return False
+        self.probing = True
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.probing = False
+        if self.state != CLOSED:
+            self._transition(CLOSED)
+
+    def release(self) -> None:
+        # The call was abandoned by its caller, so it proves nothing either way
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.probing = False
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            self.opened_at = time.monotonic()
+            self._transition(OPEN)
+
+    def _transition(self, state: str) -> None:
+        if state == OPEN:
+            logger.warning(f"Circuit for {self.upstream} opened after {self.failures} failures")
+        elif state == CLOSED:
+            logger.info(f"Circuit for {self.upstream} closed")
+        self.state = state
+        UPSTREAM_BREAKER_STATE.labels(self.upstream).set(_STATE_VALUES[state])
+        UPSTREAM_BREAKER_TRANSITIONS.labels(self.upstream, state).inc()
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.failures}
+
+
+def backoff_delay(attempt: int) -> float:
+    # Full jitter, so callers that failed together do not retry together
+    return random.uniform(0, min(UPSTREAM_BACKOFF_MAX, UPSTREAM_BACKOFF_BASE * 2 ** (attempt - 1)))
+
+
+def is_retryable(idempotent: bool, error: Optional[Exception] = None, status_code: Optional[int] = None) -> bool:
+    if error is not None:
+        # A refused or timed-out connect never sent the request, so even a POST may be repeated
+        return idempotent or isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout))
+    return idempotent and status_code in RETRYABLE_STATUSES
+
+
+def is_failure(error: Optional[Exception] = None, status_code: Optional[int] = None) -> bool:
+    # Only transport errors and 5xx count against the breaker, a 404 is a healthy answer
+    return error is not None or status_code >= 500
+
+
+async def resilient_request(client: httpx.AsyncClient, upstream: str, breaker: CircuitBreaker, budget: RetryBudget,
+                            deadline: float, method: str, url: str, idempotent: Optional[bool] = None,
+                            **kwargs) -> httpx.Response:
+    """One logical call: attempts share the deadline, retries draw on the budget, the breaker sees every attempt.
+
+    Raises UpstreamUnavailable when the breaker is open or no attempt got an answer. Otherwise
+    the last answer is returned whatever its status.
+    """
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+    expires_at = time.monotonic() + deadline
+    budget.deposit()
+    attempt = 0
+    while True:
+        attempt += 1
+        if not breaker.allow():
+            UPSTREAM_REJECTED.labels(upstream, "circuit_open").inc()
+            raise UpstreamUnavailable(upstream, "circuit open")
+
+        error, response = None, None
+        try:
+            response = await asyncio.wait_for(client.request(method, url, **kwargs), expires_at - time.monotonic())
+        except (httpx.TransportError, asyncio.TimeoutError) as e:
+            error = e
+        except BaseException:
+            breaker.release()
+            raise
+        status_code = response.status_code if response is not None else None
+
+        if not is_failure(error, status_code):
+            breaker.record_success()
+            return response
+        breaker.record_failure()
+
+        delay = backoff_delay(attempt)
+        if (attempt < UPSTREAM_MAX_ATTEMPTS and is_retryable(idempotent, error, status_code)
+                and expires_at - time.monotonic() > delay):
+            if budget.withdraw():
+                UPSTREAM_RETRIES.labels(upstream, "retried").inc()
+                logger.debug("Retrying %s %s on %s in %.3fs after %s", method, url, upstream, delay,
+                             type(error).__name__ if error else status_code)
+                await asyncio.sleep(delay)
+                continue
+            UPSTREAM_RETRIES.labels(upstream, "budget_exhausted").inc()
+
+        if error is not None:
+            reason = DEADLINE_EXCEEDED if isinstance(error, asyncio.TimeoutError) else type(error).__name__
+            raise UpstreamUnavailable(upstream, reason) from error
+        return response
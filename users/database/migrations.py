@@ -0,0 +1,21 @@
+from sqlalchemy import insert, literal, select
+from models.users import User
+from models.outbox import OutboxEvent
+
+
+def initial_schema(connection) -> None:
+    # checkfirst keeps this safe on databases created before migrations existed
+    User.__table__.metadata.create_all(connection)
+
+
+def outbox(connection) -> None:
+    OutboxEvent.__table__.create(connection, checkfirst=True)
+    # Subscribers learn about the users that existed before the outbox from these events
+    existing = select(literal("user"), literal("created"), User.id)
+    connection.execute(insert(OutboxEvent).from_select(["kind", "event", "entity_id"], existing))
+
+
+MIGRATIONS = [
+    (1, "Initial schema", initial_schema),
+    (2, "Transactional outbox for user events", outbox),
+]
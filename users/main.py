@@ -1,15 +1,30 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Header
-from sqlmodel import select, Session
+from fastapi import FastAPI, Depends, HTTPException, status, Header, Query, Response
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from typing import List, Optional
 
 from starlette.responses import JSONResponse
 
-from models.users import User
-from database.db import wait_for_db, get_session
-import httpx
+from models.users import User, UserBatchRequest, UserBatchResponse
+from database.db import async_engine, engine, wait_for_db, get_session, open_session, apply_migrations, ping_db
+from database.migrations import MIGRATIONS
+from database.outbox import CREATED, DELETED, outbox_relay, record_event
+from database.pool import pool_stats
+from observability.health import Startup, setup_health
+from observability.log import setup_logging
+from observability.metrics import setup_metrics
+from observability.profiling import setup_profiling
+from middleware.admission import setup_admission
+from security.tokens import verify_token
+from utils.pagination import MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, decode_cursor, paginate, set_next_cursor
+from utils.fast_json import FAST_LIST_RESPONSES, model_columns, rows_response
+from utils.singleflight import SingleFlight
+from clients.http import upstreams
+import asyncio
 import logging
+import os
 
-logging.basicConfig(level=logging.INFO)
+setup_logging(engine, async_engine)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(
@@ -17,13 +32,53 @@ app = FastAPI(
     description="API for managing user profiles",
     version="1.0.0"
 )
+setup_metrics(app, engine, async_engine)
+setup_profiling(app, engine, async_engine)
+setup_admission(app)
+
+startup = Startup(
+    ("database", wait_for_db),
+    ("migrations", lambda: apply_migrations(MIGRATIONS)),
+    ("outbox", outbox_relay.start),
+)
+setup_health(app, startup, ping_db)
+
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "500"))
+
+user_reads = SingleFlight("users")
 
 
 @app.on_event("startup")
 async def startup_event():
     logger.info("Starting application...")
-    wait_for_db()
-    logger.info("Application startup complete")
+    startup.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await startup.cancel()
+    await outbox_relay.stop()
+    await upstreams.aclose()
+
+
+@app.get("/internal/db-pool", include_in_schema=False)
+async def db_pool_stats():
+    return {"sync": pool_stats(engine), "async": pool_stats(async_engine)}
+
+
+@app.get("/internal/http-pool", include_in_schema=False)
+async def http_pool_stats():
+    return upstreams.stats()
+
+
+@app.get("/internal/outbox", include_in_schema=False)
+async def outbox_stats():
+    return await outbox_relay.stats()
+
+
+@app.get("/internal/coalescing", include_in_schema=False)
+async def coalescing_stats():
+    return user_reads.stats()
 
 
 @app.post("/users",
@@ -34,20 +89,14 @@ async def startup_event():
 async def create_user(
         user: User,
         token: str = Header(..., alias="Authorization"),
-        session: Session = Depends(get_session)
+        session: AsyncSession = Depends(get_session)
 ):
-    async with httpx.AsyncClient() as client:
-        r = await client.post(
-            "http://auth:8001/verify",
-            headers={"Authorization": f"Bearer {token}"}
-        )
-    if r.status_code != 200:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    await verify_token(token)
 
     try:
-        existing_user = session.exec(
+        existing_user = (await session.exec(
             select(User).where(User.email == user.email)
-        ).first()
+        )).first()
 
         if existing_user:
             raise HTTPException(
@@ -56,29 +105,69 @@ async def create_user(
             )
 
         session.add(user)
-        session.commit()
-        session.refresh(user)
+        await session.flush()
+        record_event(session, "user", CREATED, user.id)
+        await session.commit()
+        await session.refresh(user)
+        outbox_relay.notify()
 
         logger.info(f"Created new user with ID: {user.id}")
         return user
 
     except Exception as e:
         logger.error(f"Error creating user: {str(e)}")
-        session.rollback()
+        await session.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to create user"
         )
 
 
+@app.post("/users/batch",
+          response_model=UserBatchResponse,
+          summary="Get several users by ID",
+          responses={
+              400: {"description": "Too many IDs requested"}
+          })
+async def get_users_batch(
+        batch: UserBatchRequest,
+        session: AsyncSession = Depends(get_session)
+):
+    ids = list(dict.fromkeys(batch.ids))
+    if len(ids) > BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {BATCH_MAX_SIZE} IDs can be requested at once"
+        )
+
+    users = (await session.exec(select(User).where(User.id.in_(ids)))).all() if ids else []
+    found = {user.id: user for user in users}
+    return UserBatchResponse(
+        users=[found[user_id] for user_id in ids if user_id in found],
+        missing=[user_id for user_id in ids if user_id not in found]
+    )
+
+
+async def _load_user(user_id: int) -> Optional[User]:
+    async with open_session() as session:
+        return await session.get(User, user_id)
+
+
 @app.get("/users/{user_id}",
          response_model=User,
          summary="Get user by ID",
          responses={
              404: {"description": "User not found"}
          })
-async def get_user(user_id: int, session: Session = Depends(get_session)):
-    user = session.get(User, user_id)
+async def get_user(user_id: int):
+    # Concurrent reads of one user share a single lookup
+    try:
+        user = await user_reads.do(user_id, lambda: _load_user(user_id))
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Timed out loading the user"
+        )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -91,20 +180,41 @@ async def get_user(user_id: int, session: Session = Depends(get_session)):
          response_model=List[User],
          summary="List all users")
 async def list_users(
-        skip: int = 0,
-        limit: int = 100,
+        response: Response,
+        limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
         is_active: Optional[bool] = None,
-        session: Session = Depends(get_session)
+        unbounded: bool = Query(False, description="Return every matching user in one response"),
+        skip: int = Query(0, ge=0, deprecated=True, description="Replaced by cursor; only 0 is accepted"),
+        session: AsyncSession = Depends(get_session)
 ):
-    query = select(User)
+    # Ignoring skip would hand every offset-paging client the first page forever
+    if skip:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="skip is no longer supported, page with the cursor from the X-Next-Cursor header instead"
+        )
+
+    # The fast path fetches plain column tuples and encodes them directly
+    query = select(*model_columns(User)) if FAST_LIST_RESPONSES else select(User)
+    query = query.order_by(User.id)
 
     if is_active is not None:
         query = query.where(User.is_active == is_active)
 
-    users = session.exec(
-        query.offset(skip).limit(limit)
-    ).all()
+    if unbounded:
+        users = (await session.exec(query)).all()
+        return rows_response(User, users) if FAST_LIST_RESPONSES else users
+
+    if cursor:
+        last_id, = decode_cursor(cursor, (int,))
+        query = query.where(User.id > last_id)
 
+    rows = (await session.exec(query.limit(limit + 1))).all()
+    users, next_cursor = paginate(rows, limit, key=lambda user: (user.id,))
+    if FAST_LIST_RESPONSES:
+        return rows_response(User, users, {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None)
+    set_next_cursor(response, next_cursor)
     return users
 
 
@@ -118,17 +228,11 @@ async def update_user_partially(
         user_id: int,
         updated_data: User,
         token: str = Header(..., alias="Authorization"),
-        session: Session = Depends(get_session)
+        session: AsyncSession = Depends(get_session)
 ):
-    async with httpx.AsyncClient() as client:
-        r = await client.post(
-            "http://auth:8001/verify",
-            headers={"Authorization": f"Bearer {token}"}
-        )
-    if r.status_code != 200:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    await verify_token(token)
 
-    user = session.get(User, user_id)
+    user = await session.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -140,8 +244,9 @@ async def update_user_partially(
         setattr(user, key, value)
 
     session.add(user)
-    session.commit()
-    session.refresh(user)
+    await session.commit()
+    await session.refresh(user)
+    user_reads.forget(user_id)
 
     return user
 
@@ -155,25 +260,22 @@ async def update_user_partially(
 async def delete_user(
         user_id: int,
         token: str = Header(..., alias="Authorization"),
-        session: Session = Depends(get_session)
+        session: AsyncSession = Depends(get_session)
 ):
-    async with httpx.AsyncClient() as client:
-        r = await client.post(
-            "http://auth:8001/verify",
-            headers={"Authorization": f"Bearer {token}"}
-        )
-    if r.status_code != 200:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    await verify_token(token)
 
-    user = session.get(User, user_id)
+    user = await session.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
 
-    session.delete(user)
-    session.commit()
+    await session.delete(user)
+    record_event(session, "user", DELETED, user_id)
+    await session.commit()
+    user_reads.forget(user_id)
+    outbox_relay.notify()
 
     return JSONResponse(
         content={"detail": "The user was deleted successfully"},
@@ -1,5 +1,6 @@
 from sqlmodel import SQLModel, Field
 from datetime import date
+from typing import List
 
 
 class User(SQLModel, table=True):
@@ -11,3 +12,12 @@ class User(SQLModel, table=True):
     birthdate: date | None = None
     phone_number: str | None = Field(default=None, max_length=20)
     address: str | None = None
+
+
+class UserBatchRequest(SQLModel):
+    ids: List[int]
+
+
+class UserBatchResponse(SQLModel):
+    users: List[User]
+    missing: List[int]
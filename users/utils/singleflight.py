@@ -0,0 +1,64 @@
+from observability.metrics import COALESCED_READS
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+import asyncio
+import os
+
+T = TypeVar("T")
+
+# Upper bound for one shared lookup; every caller waiting on it gets the TimeoutError
+SINGLEFLIGHT_TIMEOUT = float(os.getenv("SINGLEFLIGHT_TIMEOUT", "5"))
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one run of the loader and its outcome.
+
+    The loader runs in its own task, so a caller that disconnects does not cancel it
+    for the others; it must therefore open its own session instead of using the request's.
+    """
+
+    def __init__(self, name: str, timeout: float = SINGLEFLIGHT_TIMEOUT):
+        self.name = name
+        self.timeout = timeout
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.followers = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    async def do(self, key: Hashable, loader: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._run(loader))
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key) if self._calls.get(key) is task else None)
+            self.leaders += 1
+            COALESCED_READS.labels(self.name, "leader").inc()
+        else:
+            self.followers += 1
+            COALESCED_READS.labels(self.name, "follower").inc()
+        return await asyncio.shield(task)
+
+    async def _run(self, loader: Callable[[], Awaitable[T]]) -> T:
+        try:
+            return await asyncio.wait_for(loader(), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        except Exception:
+            self.errors += 1
+            raise
+
+    def forget(self, key: Hashable) -> None:
+        # After a write, later callers start a fresh lookup instead of joining one that may predate it
+        self._calls.pop(key, None)
+
+    def stats(self) -> dict:
+        calls = self.leaders + self.followers
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "coalescing_ratio": round(self.followers / calls, 4) if calls else 0.0,
+        }